@@ -2,16 +2,20 @@ import argparse
 import bpy
 import os
 import sys
+import json
+import shutil
+import filecmp
 import addon_utils
 
 
-def get_args():
+def get_args(script_args=None):
     parser = argparse.ArgumentParser()
 
     # get all script args
-    _, all_arguments = parser.parse_known_args()
-    double_dash_index = all_arguments.index('--')
-    script_args = all_arguments[double_dash_index + 1: ]
+    if script_args is None:
+        _, all_arguments = parser.parse_known_args()
+        double_dash_index = all_arguments.index('--')
+        script_args = all_arguments[double_dash_index + 1: ]
 
     # add parser rules
     parser.add_argument('-sx', '--sxaddonpath', help='Path to SX Tools 2 addon')
@@ -22,13 +26,13 @@ def get_args():
     parser.add_argument('-sp', '--palette', help='Palette Override')
     parser.add_argument('-st', '--staticvertexcolors', action='store_true', help='Flatten layers to VertexColor0')
     parser.add_argument('-co', '--collideroffset', help='Convex Hull Shrink Offset')
+    parser.add_argument('-ob', '--objects', nargs='+', help='Only process these objects and their children')
+    parser.add_argument('-va', '--variants', help='JSON list of override variants to export from one file load')
+    parser.add_argument('-pool', '--pool', action='store_true', help='Keep running and read jobs from stdin')
+    parser.add_argument('-i', '--inputs', nargs='+', help='Source files to process in one session')
     parsed_script_args, _ = parser.parse_known_args(script_args)
     return parsed_script_args
 
-args = get_args()
-export_path = os.path.abspath(args.exportpath) + os.path.sep
-library_path = os.path.abspath(args.librarypath) + os.path.sep
-
 
 # ------------------------------------------------------------------------
 #    Check if SX Tools 2 is already installed
@@ -44,7 +48,7 @@ def install_addon(addon_path):
     if os.path.isfile(addon_path) and addon_path.endswith('.py'):
         print(f'Installing SX Tools 2 from Python file: {addon_path}')
         bpy.ops.preferences.addon_install(filepath=addon_path)
-        bpy.ops.preferences.addon_enable(module='sxtools2')    
+        bpy.ops.preferences.addon_enable(module='sxtools2')
     # For a directory, look for sxtools2.py
     elif os.path.isdir(addon_path):
         main_file = os.path.join(addon_path, 'sxtools2.py')
@@ -60,82 +64,227 @@ def install_addon(addon_path):
         sys.exit(1)
 
 
-if check_installed():
-    try:
-        bpy.ops.preferences.addon_enable(module='sxtools2')
-        print("SX Tools 2 installed and enabled.")
-    except Exception as e:
-        print(f"Error enabling SX Tools 2: {e}")
-else:
-    print("SX Tools 2 not found. Attempting to install.")
-    if args.sxaddonpath:
-        addon_path = os.path.abspath(args.sxaddonpath)
-        install_addon(addon_path)
+def enable_addon(args):
+    if check_installed():
+        try:
+            bpy.ops.preferences.addon_enable(module='sxtools2')
+            print("SX Tools 2 installed and enabled.")
+        except Exception as e:
+            print(f"Error enabling SX Tools 2: {e}")
     else:
-        print('Error: SX Tools 2 is not installed and no addon path provided.')
-        print('Please provide the path to SX Tools 2 addon with -sx/--sxaddonpath parameter.')
-        sys.exit(1)
+        print("SX Tools 2 not found. Attempting to install.")
+        if args.sxaddonpath:
+            addon_path = os.path.abspath(args.sxaddonpath)
+            install_addon(addon_path)
+        else:
+            print('Error: SX Tools 2 is not installed and no addon path provided.')
+            print('Please provide the path to SX Tools 2 addon with -sx/--sxaddonpath parameter.')
+            sys.exit(1)
 
 
 # ------------------------------------------------------------------------
 #    The below steps are designed for use with SX Tools 2 Blender addon.
 #    Edit according to the needs of your project.
 # ------------------------------------------------------------------------
+def process_file(args):
+    export_path = os.path.abspath(args.exportpath) + os.path.sep
+    # exports of this process are collected apart from concurrent Blenders
+    staging_path = os.path.join(export_path, f'.sx_staging_{os.getpid()}') + os.path.sep
+    os.makedirs(staging_path, exist_ok=True)
+    try:
+        export_file(args, staging_path)
+        publish_exports(staging_path, export_path)
+    finally:
+        # files left by a failed export are not published
+        shutil.rmtree(staging_path, ignore_errors=True)
 
-bpy.context.preferences.addons['sxtools2'].preferences.libraryfolder = library_path
-bpy.context.preferences.addons['sxtools2'].preferences.flipsmartx = False
-bpy.context.preferences.addons['sxtools2'].preferences.exportspace = 'LIN'
-bpy.context.preferences.addons['sxtools2'].preferences.exportroughness = 'SMOOTH'
-bpy.data.scenes['Scene'].sx2.exportfolder = export_path
-if args.format in ['fbx', 'gltf']:
-    bpy.context.preferences.addons['sxtools2'].preferences.exportformat = args.format.upper()
 
-# If objects have legacy sxtools properties, convert to sx2 first
-# bpy.ops.object.select_all(action='SELECT')
-# bpy.ops.sx2.sxtosx2('EXEC_DEFAULT')
+def export_file(args, staging_path):
+    library_path = os.path.abspath(args.librarypath) + os.path.sep
 
-bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-bpy.ops.object.select_all(action='SELECT')
+    bpy.context.preferences.addons['sxtools2'].preferences.libraryfolder = library_path
+    bpy.context.preferences.addons['sxtools2'].preferences.flipsmartx = False
+    bpy.context.preferences.addons['sxtools2'].preferences.exportspace = 'LIN'
+    bpy.context.preferences.addons['sxtools2'].preferences.exportroughness = 'SMOOTH'
+    bpy.data.scenes['Scene'].sx2.exportfolder = staging_path
+    # a job without a format exports in the add-on's own format, not that of the previous job
+    if args.format in ['fbx', 'gltf']:
+        bpy.context.preferences.addons['sxtools2'].preferences.exportformat = args.format.upper()
+    elif default_format is not None:
+        bpy.context.preferences.addons['sxtools2'].preferences.exportformat = default_format
 
-if args.subdivision is not None:
-    subdivision = int(args.subdivision)
-    for obj in bpy.context.view_layer.objects.selected:
-        if 'sx2' in obj.keys():
-            obj.sx2.subdivisionlevel = subdivision
+    # If objects have legacy sxtools properties, convert to sx2 first
+    # bpy.ops.object.select_all(action='SELECT')
+    # bpy.ops.sx2.sxtosx2('EXEC_DEFAULT')
 
-if (args.palette is not None):
-    if args.palette in bpy.context.scene.sxpalettes.keys():
-        palette = str(args.palette)
-        bpy.ops.sx2.applypalette('EXEC_DEFAULT', label=palette)
-    else:
-        print('SX Batch: Invalid palette name!')
+    bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+    bpy.ops.object.select_all(action='SELECT')
+
+    # Object shards of a large file only select their own hierarchies
+    if args.objects:
+        bpy.ops.object.select_all(action='DESELECT')
+        for obj_name in args.objects:
+            if obj_name in bpy.context.view_layer.objects:
+                root = bpy.data.objects[obj_name]
+                for obj in [root, ] + list(root.children_recursive):
+                    if obj.name in bpy.context.view_layer.objects:
+                        obj.select_set(True)
+            else:
+                print(f'SX Batch: Object {obj_name} not found!')
+
+    if args.subdivision is not None:
+        subdivision = int(args.subdivision)
+        for obj in bpy.context.view_layer.objects.selected:
+            if 'sx2' in obj.keys():
+                obj.sx2.subdivisionlevel = subdivision
+
+    if (args.palette is not None):
+        if args.palette in bpy.context.scene.sxpalettes.keys():
+            palette = str(args.palette)
+            bpy.ops.sx2.applypalette('EXEC_DEFAULT', label=palette)
+        else:
+            print('SX Batch: Invalid palette name!')
+
+    if args.staticvertexcolors is not None:
+        for obj in bpy.context.view_layer.objects.selected:
+            if 'sx2' in obj.keys():
+                obj.sx2.staticvertexcolors = str(int(bool(args.staticvertexcolors)))
+
+    if args.collideroffset is not None:
+        for obj in bpy.context.view_layer.objects.selected:
+            if 'sx2' in obj.keys():
+                obj.sx2.collideroffsetfactor = float(args.collideroffset)
 
-if args.staticvertexcolors is not None:
     for obj in bpy.context.view_layer.objects.selected:
         if 'sx2' in obj.keys():
-            obj.sx2.staticvertexcolors = str(int(bool(args.staticvertexcolors)))
+            obj['sxToolsVersion'] = 'SX Tools 2 for Blender ' + str(sys.modules['sxtools2'].bl_info.get('version'))
 
-if args.collideroffset is not None:
+    # Disable mesh poly count optimizations
     for obj in bpy.context.view_layer.objects.selected:
-        if 'sx2' in obj.keys():
-            obj.sx2.collideroffsetfactor = float(args.collideroffset)
+        if 'sxWeld' in obj.modifiers.keys():
+            obj.modifiers['sxWeld'].show_viewport = False
+
+        if 'sxDecimate' in obj.modifiers.keys():
+                obj.modifiers['sxDecimate'].show_viewport = False
+
+        if 'sxDecimate2' in obj.modifiers.keys():
+                obj.modifiers['sxDecimate2'].show_viewport = False
+
+    bpy.ops.sx2.macro('EXEC_DEFAULT')
+    bpy.ops.sx2.exportfiles('EXEC_DEFAULT')
+
 
-for obj in bpy.context.view_layer.objects.selected:
-    if 'sx2' in obj.keys():
-        obj['sxToolsVersion'] = 'SX Tools 2 for Blender ' + str(sys.modules['sxtools2'].bl_info.get('version'))
+# ------------------------------------------------------------------------
+#    Moves the staged exports into the export folder and lists them
+#    for the batcher, one 'SX Export:' line per written file and one
+#    'SX Unchanged:' line per file identical to the existing export,
+#    which is left untouched
+# ------------------------------------------------------------------------
+def publish_exports(staging_path, export_path):
+    for current_folder, subdirs, files in os.walk(staging_path):
+        for file in files:
+            staged_path = os.path.join(current_folder, file)
+            target_path = os.path.join(export_path, os.path.relpath(staged_path, staging_path))
+            if os.path.isfile(target_path) and filecmp.cmp(staged_path, target_path, shallow=False):
+                print(f'SX Unchanged: {target_path}', flush=True)
+                continue
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.replace(staged_path, target_path)
+            print(f'SX Export: {target_path}', flush=True)
+
+
+# ------------------------------------------------------------------------
+#    Variant mode: the loaded file is processed once per variant,
+#    reverting to the saved file in between. Each variant overrides
+#    the script arguments and exports to its own subfolder.
+# ------------------------------------------------------------------------
+def process_variants(args):
+    variants = json.loads(args.variants)
+    overrides = {
+        'format': 'format',
+        'subdivision': 'subdivision',
+        'palette': 'palette',
+        'static_vertex_colors': 'staticvertexcolors',
+        'collider_offset': 'collideroffset'
+    }
+
+    for i, variant in enumerate(variants):
+        if i > 0:
+            bpy.ops.wm.revert_mainfile()
+        variant_args = argparse.Namespace(**vars(args))
+        for key, arg in overrides.items():
+            if key in variant:
+                setattr(variant_args, arg, variant[key])
+        variant_args.exportpath = os.path.join(args.exportpath, variant['name'])
+        os.makedirs(variant_args.exportpath, exist_ok=True)
+        print(f'SX Batch: Exporting variant {variant["name"]}', flush=True)
+        process_file(variant_args)
+
+
+def process(args):
+    if args.variants:
+        process_variants(args)
+    else:
+        process_file(args)
+
+
+# ------------------------------------------------------------------------
+#    Opens a source file, processes it and resets to an empty scene.
+#    Used when one Blender processes several files.
+# ------------------------------------------------------------------------
+def run_job(source_file, args):
+    status = 'done'
+    try:
+        # Preferences survive file loads, but re-check after a reset
+        if 'sxtools2' not in bpy.context.preferences.addons:
+            enable_addon(args)
+        bpy.ops.wm.open_mainfile(filepath=source_file, load_ui=False)
+        process(args)
+    except Exception as e:
+        print(f'SX Batch Error: {source_file}: {e}')
+        status = 'failed'
 
-# Disable mesh poly count optimizations
-for obj in bpy.context.view_layer.objects.selected:
-    if 'sxWeld' in obj.modifiers.keys():
-        obj.modifiers['sxWeld'].show_viewport = False
+    # Release the scene data before the next job
+    bpy.ops.wm.read_homefile(use_empty=True)
+    sys.stdout.flush()
+    return status
 
-    if 'sxDecimate' in obj.modifiers.keys():
-            obj.modifiers['sxDecimate'].show_viewport = False
 
-    if 'sxDecimate2' in obj.modifiers.keys():
-            obj.modifiers['sxDecimate2'].show_viewport = False
+# ------------------------------------------------------------------------
+#    Pool mode: the batcher keeps this Blender running and sends
+#    one JSON job per line to stdin. Each job names the source file
+#    and carries the same script arguments as a single run.
+# ------------------------------------------------------------------------
+def serve_jobs(args):
+    print('SX Pool: ready', flush=True)
+    for line in sys.stdin:
+        if len(line.strip()) == 0:
+            continue
+        job = json.loads(line)
+        status = run_job(job['source_file'], get_args(job['args']))
+        print('SX Pool: ' + json.dumps({'source_file': job['source_file'], 'status': status}), flush=True)
+
 
-bpy.ops.sx2.macro('EXEC_DEFAULT')
-bpy.ops.sx2.exportfiles('EXEC_DEFAULT')
+# ------------------------------------------------------------------------
+#    Session mode: the source files given with -i are processed
+#    in sequence with the same script arguments
+# ------------------------------------------------------------------------
+def process_session(args):
+    print('SX Session: ' + json.dumps({'status': 'ready'}), flush=True)
+    for source_file in args.inputs:
+        status = run_job(source_file, args)
+        print('SX Session: ' + json.dumps({'source_file': source_file, 'status': status}), flush=True)
+
+
+args = get_args()
+enable_addon(args)
+default_format = bpy.context.preferences.addons['sxtools2'].preferences.exportformat if 'sxtools2' in bpy.context.preferences.addons else None
+
+if args.pool:
+    serve_jobs(args)
+elif args.inputs:
+    process_session(args)
+else:
+    process(args)
 
 bpy.ops.wm.quit_blender('EXEC_DEFAULT')
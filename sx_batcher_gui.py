@@ -1,15 +1,26 @@
 import logging
 import signal
+import asyncio
+import re
+import gzip
+import zlib
+import hashlib
+import collections
 import argparse
 import threading
 import subprocess
 import multiprocessing
+import concurrent.futures
 import time
 import json
+import sqlite3
+import queue
 import socket
 import pathlib
 import struct
 import shutil
+import filecmp
+import tempfile
 import os
 import sys
 import platform
@@ -44,9 +55,33 @@ class SXBATCHER_globals(object):
         self.ip_addr = init.get_ip()
         self.performance_index = float(conf.get('performance_index', 0))
 
+        # Adaptive sharing lends up to shared_cores depending on local load and user activity
+        self.adaptive_cores = bool(int(conf.get('adaptive_cores', False)))
+        self.adaptive_idle_time = int(conf.get('adaptive_idle_time', 300))
+        self.adaptive_active_cores = int(conf.get('adaptive_active_cores', 1))
+        self.adaptive_headroom = float(conf.get('adaptive_headroom', 1.0))
+        self.available_cores = self.shared_cores
+
         self.then = None
         self.now = None
         self.remote_task = False
+        self.remote_job = None
+
+        # Scratch locations of node jobs, empty for the script folder, staging may be a tmpfs like /dev/shm
+        self.scratch_root = conf.get('scratch_root', '')
+        self.staging_root = conf.get('staging_root', '')
+        self.min_free_space = int(conf.get('min_free_space', 2048))
+
+        # Export artifact cache, empty root for the script folder, size limit in MB
+        self.use_cache = bool(int(conf.get('use_cache', False)))
+        self.cache_root = conf.get('cache_root', '')
+        self.cache_size = int(conf.get('cache_size', 10240))
+
+        # Shared cache service, served on cache_port and used when cache_server is host:port
+        self.serve_cache = bool(int(conf.get('serve_cache', False)))
+        self.cache_server = conf.get('cache_server', '')
+        self.cache_port = int(conf.get('cache_port', 50002))
+        self.cache_claim_timeout = int(conf.get('cache_claim_timeout', 1800))
 
         # Batch lists
         self.export_objs = None
@@ -54,6 +89,14 @@ class SXBATCHER_globals(object):
         self.source_costs = None
         self.remote_assignment = []
         self.errors = []
+        self.task_times = {}
+        self.task_reports = {}
+        self.task_outputs = {}
+        self.outputs_changed = 0
+        self.outputs_unchanged = 0
+        self.tasks_done = 0
+        self.tasks_total = 0
+        self.eta = None
         self.revision_dict = {}
 
         # Blender setting overrides
@@ -68,6 +111,54 @@ class SXBATCHER_globals(object):
         self.collider_offset = bool(int(conf.get('collider_offset', False)))
         self.collider_offset_value = float(conf.get('collider_offset_value', 0.0))
         self.revision_export = bool(int(conf.get('revision_export', False)))
+        self.incremental_export = bool(int(conf.get('incremental_export', False)))
+
+        # Persistent Blender pool settings, recycle limits of 0 disable the check
+        self.blender_pool = bool(int(conf.get('blender_pool', False)))
+        self.pool_recycle_count = int(conf.get('pool_recycle_count', 50))
+        self.pool_memory_limit = int(conf.get('pool_memory_limit', 4096))
+
+        # Blender output handling, matching a fatal pattern kills the Blender process
+        self.task_logs = bool(int(conf.get('task_logs', True)))
+        self.log_tail_lines = int(conf.get('log_tail_lines', 200))
+        self.fatal_patterns = conf.get('fatal_patterns', ['Segmentation fault', 'EXCEPTION_ACCESS_VIOLATION', 'MemoryError', 'Cannot read file'])
+
+        # Watchdog, time budget is task_timeout plus task_timeout_per_kcost seconds per 1000 cost, 0 disables a check
+        self.task_timeout = int(conf.get('task_timeout', 600))
+        self.task_timeout_per_kcost = float(conf.get('task_timeout_per_kcost', 2.0))
+        self.stall_timeout = int(conf.get('stall_timeout', 120))
+        self.silence_timeout = int(conf.get('silence_timeout', 900))
+        self.task_retries = int(conf.get('task_retries', 1))
+
+        # Upper limit of Blender threads per task, 0 for no limit
+        self.max_task_threads = int(conf.get('max_task_threads', 0))
+
+        # Memory admission in MB, a budget of 0 uses 90% of available memory at batch start
+        self.memory_budget = int(conf.get('memory_budget', 0))
+        self.default_task_memory = int(conf.get('default_task_memory', 1024))
+
+        # Override variants exported from each file load, each a dict with a name and
+        # any of format, subdivision, palette, static_vertex_colors and collider_offset
+        self.export_variants = conf.get('export_variants', [])
+
+        # Files above this cost with several catalogue objects are split into object shards, 0 disables
+        self.shard_cost = int(conf.get('shard_cost', 0))
+
+        # Blender sessions process several light files per launch, startup is kept below this share of session time
+        self.blender_sessions = bool(int(conf.get('blender_sessions', False)))
+        self.session_overhead_ratio = float(conf.get('session_overhead_ratio', 0.1))
+
+        # Use the autotuned process and thread counts when this hardware has been tuned
+        self.use_autotune = bool(int(conf.get('use_autotune', True)))
+
+        # Pin each Blender to its own CPUs on Linux
+        self.cpu_affinity = bool(int(conf.get('cpu_affinity', False)))
+
+        # Isolation of Blenders processing node tasks, limits in cores and MB, 0 for no limit
+        self.node_nice = int(conf.get('node_nice', 10))
+        self.node_io_idle = bool(int(conf.get('node_io_idle', True)))
+        self.node_cpu_limit = float(conf.get('node_cpu_limit', 0))
+        self.node_memory_limit = int(conf.get('node_memory_limit', 0))
 
         # Network settings
         self.group = '239.1.1.1'
@@ -131,6 +222,7 @@ class SXBATCHER_exit_handler:
 # ------------------------------------------------------------------------
 class SXBATCHER_init(object):
     def __init__(self):
+        self.output_lock = threading.Lock()
         return None
 
 
@@ -165,7 +257,33 @@ class SXBATCHER_init(object):
         parser.add_argument('-st', '--staticvertexcolors', action='store_true', help='SX Tools flatten layers to VertexColor0')
         parser.add_argument('-v', '--verbose', action='store_true', help='Display Blender debug messages')
         parser.add_argument('-re', '--revisionexport', action='store_true', help='Export changed revisions ')
+        parser.add_argument('-ie', '--incremental', action='store_true', help='Export only tasks whose inputs changed since their last export')
+        parser.add_argument('-ca', '--cache', action='store_true', help='Restore unchanged exports from the artifact cache')
+        parser.add_argument('-cr', '--cacheroot', help='Folder for the artifact cache')
+        parser.add_argument('-cs', '--cachesize', type=int, help='Artifact cache size limit in MB')
+        parser.add_argument('-cv', '--servecache', action='store_true', help='Serve the artifact cache to other batchers')
+        parser.add_argument('-cu', '--cacheserver', help='Use the cache service at host[:port]')
+        parser.add_argument('-bp', '--blenderpool', action='store_true', help='Keep headless Blenders running between files')
+        parser.add_argument('-pr', '--poolrecycle', type=int, help='Restart pooled Blenders after this many files')
+        parser.add_argument('-pm', '--poolmemory', type=int, help='Restart pooled Blenders above this RSS in MB')
+        parser.add_argument('-fp', '--fatalpattern', action='append', help='Kill Blender when its output matches this regex (repeatable)')
+        parser.add_argument('-nl', '--nologs', action='store_true', help='Do not write compressed per-task Blender logs')
+        parser.add_argument('-to', '--tasktimeout', type=int, help='Base time budget in seconds per file, 0 to disable')
+        parser.add_argument('-rt', '--retries', type=int, help='Retry attempts for hung Blender processes')
+        parser.add_argument('-mb', '--memorybudget', type=int, help='Memory budget in MB for concurrent Blenders')
+        parser.add_argument('-vr', '--variants', help='JSON file with a list of export variants')
+        parser.add_argument('-sc', '--shardcost', type=int, help='Split files above this cost into object shards, 0 to disable')
+        parser.add_argument('-ss', '--sessions', action='store_true', help='Process several light files per Blender launch')
+        parser.add_argument('-at', '--autotune', action='store_true', help='Measure the best Blender process and thread counts for this node')
+        parser.add_argument('-af', '--affinity', action='store_true', help='Pin each Blender to its own CPUs (Linux)')
+        parser.add_argument('-ab', '--affinitybenchmark', action='store_true', help='Compare pinned and unpinned benchmark throughput')
         parser.add_argument('-cpu', '--sharecpus', help='Select number of logical cores for node')
+        parser.add_argument('-sr', '--scratchroot', help='Folder for node job results')
+        parser.add_argument('-sg', '--stagingroot', help='Folder for received source files, e.g. /dev/shm')
+        parser.add_argument('-ac', '--adaptivecores', action='store_true', help='Adjust shared cores to local load and user activity')
+        parser.add_argument('-ni', '--nice', type=int, help='Nice level of Blenders processing node tasks (0-19)')
+        parser.add_argument('-cl', '--cpulimit', type=float, help='cgroup CPU limit in cores for node tasks, 0 for none')
+        parser.add_argument('-ml', '--memorylimit', type=int, help='cgroup memory limit in MB for node tasks, 0 for none')
         parser.add_argument('-un', '--usenodes', action='store_true', help='Use network nodes for distributed processing')
         parser.add_argument('-l', '--logfile', help='Logfile name')
         parser.add_argument('-ll', '--loglevel', type=str.lower, help="Standard loglevels", choices=['debug', 'info', 'warning', 'error', 'critical'], default='info')
@@ -233,10 +351,58 @@ class SXBATCHER_init(object):
             sxglobals.shared_cores = max(0, min(int(args.sharecpus), multiprocessing.cpu_count()))
         else:
             sxglobals.share_cpus = False
+        if args.scratchroot is not None:
+            sxglobals.scratch_root = os.path.abspath(args.scratchroot)
+        if args.stagingroot is not None:
+            sxglobals.staging_root = os.path.abspath(args.stagingroot)
+        if args.adaptivecores:
+            sxglobals.adaptive_cores = True
+        if args.nice is not None:
+            sxglobals.node_nice = max(0, min(19, args.nice))
+        if args.cpulimit is not None:
+            sxglobals.node_cpu_limit = max(0.0, args.cpulimit)
+        if args.memorylimit is not None:
+            sxglobals.node_memory_limit = max(0, args.memorylimit)
+        if args.incremental:
+            sxglobals.incremental_export = True
+        if args.cache:
+            sxglobals.use_cache = True
+        if args.cacheroot is not None:
+            sxglobals.cache_root = os.path.abspath(args.cacheroot)
+        if args.cachesize is not None:
+            sxglobals.cache_size = max(0, args.cachesize)
+        if args.servecache:
+            sxglobals.serve_cache = True
+        if args.cacheserver is not None:
+            sxglobals.cache_server = args.cacheserver
         if args.usenodes:
             sxglobals.use_network_nodes = True
         else:
             sxglobals.use_network_nodes = False
+        if args.blenderpool:
+            sxglobals.blender_pool = True
+        if args.poolrecycle is not None:
+            sxglobals.pool_recycle_count = max(0, args.poolrecycle)
+        if args.poolmemory is not None:
+            sxglobals.pool_memory_limit = max(0, args.poolmemory)
+        if args.fatalpattern is not None:
+            sxglobals.fatal_patterns = sxglobals.fatal_patterns + args.fatalpattern
+        if args.nologs:
+            sxglobals.task_logs = False
+        if args.tasktimeout is not None:
+            sxglobals.task_timeout = max(0, args.tasktimeout)
+        if args.retries is not None:
+            sxglobals.task_retries = max(0, args.retries)
+        if args.memorybudget is not None:
+            sxglobals.memory_budget = max(0, args.memorybudget)
+        if args.variants is not None:
+            sxglobals.export_variants = init.load_json(os.path.abspath(args.variants))
+        if args.shardcost is not None:
+            sxglobals.shard_cost = max(0, args.shardcost)
+        if args.sessions:
+            sxglobals.blender_sessions = True
+        if args.affinity:
+            sxglobals.cpu_affinity = True
 
         # Populate export objects
         if args.all:
@@ -247,7 +413,7 @@ class SXBATCHER_init(object):
             sxglobals.export_objs = manager.get_tagged_objs([str(args.tag), ])
 
         # Determine headless or gui
-        if args.nogui or args.node or sxglobals.export_objs is not None:
+        if args.nogui or args.node or args.affinitybenchmark or args.autotune or args.servecache or sxglobals.export_objs is not None:
             sxglobals.headless = True
 
 
@@ -257,12 +423,19 @@ class SXBATCHER_init(object):
             "address": sxglobals.ip_addr,
             "host": socket.gethostname(),
             "system": platform.system(),
-            "cores": str(sxglobals.shared_cores),
+            "cores": str(self.get_shared_cores()),
             "performance_index": str(sxglobals.performance_index),
             "status": "Busy" if sxglobals.node_busy_status else "Idle"
         }
 
 
+    # cores currently lent to the farm
+    def get_shared_cores(self):
+        if sxglobals.adaptive_cores:
+            return min(sxglobals.shared_cores, sxglobals.available_cores)
+        return sxglobals.shared_cores
+
+
     def load_json(self, file_path):
         try:
             with open(file_path, 'r') as input:
@@ -314,9 +487,48 @@ class SXBATCHER_init(object):
             'collider_offset': str(int(sxglobals.collider_offset)),
             'collider_offset_value': str(sxglobals.collider_offset_value),
             'revision_export': str(int(sxglobals.revision_export)),
+            'incremental_export': str(int(sxglobals.incremental_export)),
+            'blender_pool': str(int(sxglobals.blender_pool)),
+            'pool_recycle_count': str(sxglobals.pool_recycle_count),
+            'pool_memory_limit': str(sxglobals.pool_memory_limit),
+            'task_logs': str(int(sxglobals.task_logs)),
+            'log_tail_lines': str(sxglobals.log_tail_lines),
+            'fatal_patterns': sxglobals.fatal_patterns,
+            'task_timeout': str(sxglobals.task_timeout),
+            'task_timeout_per_kcost': str(sxglobals.task_timeout_per_kcost),
+            'stall_timeout': str(sxglobals.stall_timeout),
+            'silence_timeout': str(sxglobals.silence_timeout),
+            'task_retries': str(sxglobals.task_retries),
+            'max_task_threads': str(sxglobals.max_task_threads),
+            'memory_budget': str(sxglobals.memory_budget),
+            'default_task_memory': str(sxglobals.default_task_memory),
+            'export_variants': sxglobals.export_variants,
+            'shard_cost': str(sxglobals.shard_cost),
+            'blender_sessions': str(int(sxglobals.blender_sessions)),
+            'session_overhead_ratio': str(sxglobals.session_overhead_ratio),
+            'use_autotune': str(int(sxglobals.use_autotune)),
+            'cpu_affinity': str(int(sxglobals.cpu_affinity)),
+            'node_nice': str(sxglobals.node_nice),
+            'node_io_idle': str(int(sxglobals.node_io_idle)),
+            'node_cpu_limit': str(sxglobals.node_cpu_limit),
+            'node_memory_limit': str(sxglobals.node_memory_limit),
             'share_cpus': str(int(sxglobals.share_cpus)),
             'shared_cores': str(int(sxglobals.shared_cores)),
             'use_nodes': str(int(sxglobals.use_network_nodes)),
+            'scratch_root': sxglobals.scratch_root,
+            'staging_root': sxglobals.staging_root,
+            'min_free_space': str(sxglobals.min_free_space),
+            'use_cache': str(int(sxglobals.use_cache)),
+            'cache_root': sxglobals.cache_root,
+            'cache_size': str(sxglobals.cache_size),
+            'serve_cache': str(int(sxglobals.serve_cache)),
+            'cache_server': sxglobals.cache_server,
+            'cache_port': str(sxglobals.cache_port),
+            'cache_claim_timeout': str(sxglobals.cache_claim_timeout),
+            'adaptive_cores': str(int(sxglobals.adaptive_cores)),
+            'adaptive_idle_time': str(sxglobals.adaptive_idle_time),
+            'adaptive_active_cores': str(sxglobals.adaptive_active_cores),
+            'adaptive_headroom': str(sxglobals.adaptive_headroom),
             'performance_index': str(sxglobals.performance_index)
         }
 
@@ -332,30 +544,64 @@ class SXBATCHER_init(object):
             return {'empty': {'empty': {'objects': ['empty', ], 'tags': ['empty', ]}}}
 
 
-    # revision data is expected to be located at the root of the export folder
-    def load_revision_data(self):
-        revision_path = sxglobals.export_path + os.path.sep + 'file_revisions.json'
-        if os.path.isfile(revision_path):
-            return self.load_json(revision_path)
-        else:
-            logging.info(f'Node {sxglobals.ip_addr} Error: file_revisions.json not found. A new one is created.')
-            revision_dict = manager.get_revisions(all=True)
-            self.save_json(revision_path, revision_dict)
-            return revision_dict
+    # resident set size of a process in MB, 0 if not available
+    def get_rss(self, pid, peak=False):
+        field = 'VmHWM:' if peak else 'VmRSS:'
+        try:
+            with open(f'/proc/{pid}/status', 'r') as status:
+                for line in status:
+                    if line.startswith(field):
+                        return int(line.split()[1]) // 1024
+        except (OSError, ValueError):
+            pass
+        return 0
 
 
-    def reset_batch_folders(self):
-        folders = ['batch_results', 'batch_submissions']
-        for folder in folders:
-            folder = str(os.path.join(os.path.dirname(__file__), folder))
-            if os.path.exists(folder):
-                shutil.rmtree(folder)
-            os.makedirs(folder, exist_ok=True)
-            logging.debug(f'Folder: {folder}')
-        logging.debug('Batch folders reset')
+    # available system memory in MB, 0 if not available
+    def get_available_memory(self):
+        try:
+            with open('/proc/meminfo', 'r') as meminfo:
+                for line in meminfo:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) // 1024
+        except (OSError, ValueError):
+            pass
+        return 0
+
+
+    # user and system CPU time of a process in seconds, None if not available
+    def get_cpu_time(self, pid):
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as stat:
+                # skip the command name, it may contain spaces
+                fields = stat.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError):
+            return None
+
+
+    # Moves a new output into place unless it is identical to the existing file,
+    # which then keeps its modification time. Returns True if the file was written.
+    def replace_if_changed(self, new_path, target_path):
+        if os.path.isfile(target_path) and filecmp.cmp(new_path, target_path, shallow=False):
+            os.remove(new_path)
+            self.count_output(False)
+            return False
+        os.replace(new_path, target_path)
+        self.count_output(True)
+        return True
+
+
+    def count_output(self, changed):
+        with self.output_lock:
+            if changed:
+                sxglobals.outputs_changed += 1
+            else:
+                sxglobals.outputs_unchanged += 1
 
 
     # files are path objects, address is a tuple of IP address and port
+    # returns ok, rejected if the receiving node declined the task data, or failed
     def transfer_files(self, address, out_files):
         payload = out_files[0]
         files = out_files[1]
@@ -368,11 +614,13 @@ class SXBATCHER_init(object):
         completed = False
         while (time.time() - then < timeout) and not completed:
             try:
-                # Send task data
-                with socket.create_connection(address, timeout=5) as sock:
+                # Send task data, the receiver replies once it has read all of it
+                with socket.create_connection(address, timeout=20) as sock, sock.makefile('rb') as stream:
                     sock.sendall(json.dumps(payload).encode('utf-8'))
-                    sock.shutdown(socket.SHUT_RDWR)
-                    sock.close()
+                    sock.shutdown(socket.SHUT_WR)
+                    status = json.loads(stream.readline())['status']
+                if status == 'rejected':
+                    return status
                 time.sleep(0.1)
 
                 # Send files
@@ -385,10 +633,1019 @@ class SXBATCHER_init(object):
                     sock.shutdown(socket.SHUT_RDWR)
                     sock.close()
                 completed = True
-            except (ConnectionResetError, TimeoutError, OSError) as error:
+            except (ConnectionResetError, TimeoutError, OSError, ValueError, KeyError) as error:
                 logging.error(f'Node {sxglobals.ip_addr} retrying transfer: {error}')
                 time.sleep(0.1)
-        return completed
+        return 'ok' if completed else 'failed'
+
+
+# ------------------------------------------------------------------------
+#    Scratch Directories
+#    Each received node batch and each benchmark gets its own job
+#    directory. Finished jobs are deleted by a background thread
+#    once nothing holds them, e.g. a result transfer in progress.
+# ------------------------------------------------------------------------
+class SXBATCHER_scratch(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.job_count = 0
+        self.cleanup_queue = queue.Queue()
+        self.cleanup_thread = None
+
+
+    # results are written below scratch_root, received source files below staging_root
+    def get_root(self, kind):
+        root = sxglobals.staging_root if kind == 'submissions' else sxglobals.scratch_root
+        if root == '':
+            root = os.path.dirname(os.path.realpath(__file__))
+        return os.path.join(root, 'sx_batcher_jobs')
+
+
+    def new_job(self, label='job'):
+        with self.lock:
+            self.job_count += 1
+            job_id = f'{label}_{int(time.time())}_{self.job_count}'
+            self.jobs[job_id] = 1
+        for kind in ('submissions', 'results'):
+            os.makedirs(self.get_dir(job_id, kind), exist_ok=True)
+        logging.debug(f'Node {sxglobals.ip_addr}: Scratch job {job_id} created')
+        return job_id
+
+
+    def get_dir(self, job_id, kind):
+        return os.path.join(self.get_root(kind), job_id, kind)
+
+
+    # a held job is not deleted before the matching release
+    def hold(self, job_id):
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id] += 1
+
+
+    def release(self, job_id):
+        with self.lock:
+            if job_id not in self.jobs:
+                return
+            self.jobs[job_id] -= 1
+            if self.jobs[job_id] > 0:
+                return
+            del self.jobs[job_id]
+        for kind in ('submissions', 'results'):
+            self.delete(os.path.dirname(self.get_dir(job_id, kind)))
+
+
+    # job directories left behind by earlier runs
+    def delete_stale(self):
+        script_dir = os.path.dirname(os.path.realpath(__file__))
+        folders = [os.path.join(script_dir, 'batch_results'), os.path.join(script_dir, 'batch_submissions')]
+        for root in set(self.get_root(kind) for kind in ('submissions', 'results')):
+            if os.path.isdir(root):
+                with self.lock:
+                    folders.extend(os.path.join(root, job_id) for job_id in os.listdir(root) if job_id not in self.jobs)
+        for folder in folders:
+            if os.path.exists(folder):
+                self.delete(folder)
+
+
+    def delete(self, folder):
+        if self.cleanup_thread is None:
+            self.cleanup_thread = threading.Thread(target=self.cleanup, daemon=True)
+            self.cleanup_thread.start()
+        self.cleanup_queue.put(folder)
+
+
+    def cleanup(self):
+        while True:
+            folder = self.cleanup_queue.get()
+            shutil.rmtree(folder, ignore_errors=True)
+            logging.debug(f'Node {sxglobals.ip_addr}: Deleted {folder}')
+            self.cleanup_queue.task_done()
+
+
+    # free space in MB on the volume of a scratch root
+    def get_free_space(self, kind):
+        path = self.get_root(kind)
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free // (1024 * 1024)
+
+
+    # received sources need their size in staging, results are assumed to be of similar size
+    def has_space(self, size):
+        size_mb = size // (1024 * 1024)
+        for kind in ('submissions', 'results'):
+            free = self.get_free_space(kind)
+            if free - size_mb < sxglobals.min_free_space:
+                logging.error(f'Node {sxglobals.ip_addr}: {free} MB free in {self.get_root(kind)}, {size_mb} MB needed with {sxglobals.min_free_space} MB reserve')
+                return False
+        return True
+
+
+    # called at exit, waits for pending deletions
+    def shutdown(self):
+        with self.lock:
+            job_ids = list(self.jobs.keys())
+            self.jobs = {}
+        for job_id in job_ids:
+            for kind in ('submissions', 'results'):
+                self.delete(os.path.dirname(self.get_dir(job_id, kind)))
+        if self.cleanup_thread is not None:
+            self.cleanup_queue.join()
+
+
+# ------------------------------------------------------------------------
+#    Export Fingerprints
+#    A task is exported again only when the hash of its inputs differs
+#    from the last successful export: source file, work script,
+#    SX Tools library, add-on and all override settings
+# ------------------------------------------------------------------------
+class SXBATCHER_fingerprints(object):
+    def __init__(self):
+        self.path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sx_fingerprints.json')
+        self.lock = threading.Lock()
+        self.file_hashes = None
+        self.exports = None
+        self.pending = {}
+
+
+    def load(self):
+        if self.exports is None:
+            data = init.load_json(self.path) if os.path.isfile(self.path) else {}
+            self.file_hashes = data.get('files', {})
+            self.exports = data.get('exports', {})
+
+
+    def save(self):
+        with self.lock:
+            if self.exports is not None:
+                init.save_json(self.path, {'files': self.file_hashes, 'exports': self.exports})
+
+
+    # content hashes are reused while size and modification time are unchanged
+    def hash_file(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return ''
+        with self.lock:
+            cached = self.file_hashes.get(file_path)
+        if (cached is not None) and (cached[0] == stat.st_size) and (cached[1] == stat.st_mtime_ns):
+            return cached[2]
+
+        file_hash = hashlib.sha256()
+        with open(file_path, 'rb') as input:
+            while chunk := input.read(1024 * 1024):
+                file_hash.update(chunk)
+        with self.lock:
+            self.file_hashes[file_path] = [stat.st_size, stat.st_mtime_ns, file_hash.hexdigest()]
+        return file_hash.hexdigest()
+
+
+    def hash_folder(self, folder):
+        folder_hash = hashlib.sha256()
+        if os.path.isfile(folder):
+            folder_hash.update(self.hash_file(folder).encode('utf-8'))
+        for current_folder, subdirs, files in sorted(os.walk(folder)):
+            subdirs[:] = [subdir for subdir in subdirs if subdir != '__pycache__']
+            for file in sorted(files):
+                file_path = os.path.join(current_folder, file)
+                folder_hash.update(os.path.relpath(file_path, folder).encode('utf-8'))
+                folder_hash.update(self.hash_file(file_path).encode('utf-8'))
+        return folder_hash.hexdigest()
+
+
+    # bl_info version of SX Tools 2, the add-on contents are hashed separately
+    def get_addon_version(self, addon_path):
+        main_file = os.path.join(addon_path, 'sxtools2.py') if os.path.isdir(addon_path) else addon_path
+        try:
+            with open(main_file, 'r', encoding='utf-8') as addon:
+                match = re.search(r'[\'"]version[\'"]\s*:\s*\(([\d,\s]+)\)', addon.read())
+            return match.group(1).replace(' ', '') if match else ''
+        except OSError:
+            return ''
+
+
+    # identifies the outputs of a task, object shards export separately
+    def get_key(self, task):
+        key = task['export_path'] + '|' + task['source_file']
+        if task.get('objects') is not None:
+            key += '|' + '|'.join(task['objects'])
+        return key
+
+
+    # paths are left out so that identical inputs match in any folder and on any node
+    def get_fingerprint(self, task, tool_hashes):
+        paths = ('blender_path', 'source_file', 'script_path', 'sxtools_addon_path', 'export_path', 'sxtools_path')
+        settings = {key: value for key, value in task.items() if key not in paths + ('threads', 'cost', 'debug')}
+        fingerprint = hashlib.sha256()
+        fingerprint.update(self.hash_file(task['source_file']).encode('utf-8'))
+        fingerprint.update(tool_hashes[(task['blender_path'], task['script_path'], task['sxtools_path'], task['sxtools_addon_path'])].encode('utf-8'))
+        fingerprint.update(dependencies.get_stamp(task['source_file']).encode('utf-8'))
+        fingerprint.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        return fingerprint.hexdigest()
+
+
+    def get_tool_hash(self, blender_path, script_path, sxtools_path, sxtools_addon_path):
+        return '|'.join([self.hash_file(blender_path), self.hash_file(script_path), self.hash_folder(sxtools_path), self.get_addon_version(sxtools_addon_path), self.hash_folder(sxtools_addon_path)])
+
+
+    def get_fingerprints(self, tasks):
+        self.load()
+        tools = set((task['blender_path'], task['script_path'], task['sxtools_path'], task['sxtools_addon_path']) for task in tasks)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, len(tasks) + len(tools))) as executor:
+            tool_hashes = dict(zip(tools, executor.map(lambda tool: self.get_tool_hash(*tool), tools)))
+            task_fingerprints = list(executor.map(lambda task: self.get_fingerprint(task, tool_hashes), tasks))
+        dependencies.save()
+        return task_fingerprints
+
+
+    # returns the tasks whose fingerprint differs from their last successful export
+    def filter(self, tasks):
+        if len(tasks) == 0:
+            return tasks
+        task_fingerprints = self.get_fingerprints(tasks)
+
+        changed = []
+        for task, fingerprint in zip(tasks, task_fingerprints):
+            key = self.get_key(task)
+            if self.exports.get(key) != fingerprint:
+                self.pending[key] = fingerprint
+                changed.append(task)
+            else:
+                batch_local.task_reused(task)
+        logging.info(f'Node {sxglobals.ip_addr}: {len(tasks) - len(changed)} of {len(tasks)} tasks unchanged since their last export')
+        self.save()
+        return changed
+
+
+    # completion hook, records the fingerprint of successful exports
+    def task_done(self, result):
+        key = self.get_key(result['task'])
+        with self.lock:
+            fingerprint = self.pending.pop(key, None)
+            if (fingerprint is not None) and (result['error'] is None):
+                self.exports[key] = fingerprint
+
+
+# ------------------------------------------------------------------------
+#    Linked Library Dependencies
+#    Library links are read from the .blend block structure without
+#    Blender and cached by file size and modification time. An asset is
+#    dirty when any library in its transitive closure has changed since
+#    the asset was last exported.
+# ------------------------------------------------------------------------
+class SXBATCHER_dependency_graph(object):
+    def __init__(self):
+        self.path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sx_dependencies.json')
+        self.lock = threading.Lock()
+        self.links = None
+
+
+    def load(self):
+        with self.lock:
+            if self.links is None:
+                self.links = init.load_json(self.path) if os.path.isfile(self.path) else {}
+
+
+    def save(self):
+        with self.lock:
+            if self.links is not None:
+                init.save_json(self.path, self.links)
+
+
+    def open_blend(self, file_path):
+        with open(file_path, 'rb') as f:
+            magic = f.read(4)
+        if magic[:2] == b'\x1f\x8b':
+            return gzip.open(file_path, 'rb')
+        if magic == b'\x28\xb5\x2f\xfd':
+            from compression import zstd
+            return zstd.open(file_path, 'rb')
+        return open(file_path, 'rb')
+
+
+    # returns the library paths stored in a .blend file, None if the file cannot be read
+    def read_links(self, file_path):
+        with self.open_blend(file_path) as f:
+            header = f.read(12)
+            if header[:7] != b'BLENDER':
+                return None
+            if header[7:9] == b'17':
+                # large block headers since Blender 5.0
+                header += f.read(5)
+                endian = '<' if header[12:13] == b'v' else '>'
+                bhead = struct.Struct(endian + '4siQqq')
+                unpack = lambda data: (data[0], data[3], data[1])
+                pointer_size = 8
+            else:
+                endian = '<' if header[8:9] == b'v' else '>'
+                pointer_size = 4 if header[7:8] == b'_' else 8
+                bhead = struct.Struct(endian + '4si' + ('I' if pointer_size == 4 else 'Q') + 'ii')
+                unpack = lambda data: (data[0], data[1], data[3])
+
+            library_blocks = []
+            dna = None
+            while True:
+                data = f.read(bhead.size)
+                if len(data) < bhead.size:
+                    break
+                code, length, sdna_index = unpack(bhead.unpack(data))
+                if code == b'ENDB':
+                    break
+                if code[:2] == b'LI' and code[2:] == b'\x00\x00':
+                    library_blocks.append((sdna_index, f.read(length)))
+                elif code == b'DNA1':
+                    dna = f.read(length)
+                else:
+                    f.seek(length, 1)
+
+        if len(library_blocks) == 0:
+            return []
+        if dna is None:
+            return None
+
+        structs = self.parse_dna(dna, endian, pointer_size)
+        links = []
+        for sdna_index, data in library_blocks:
+            fields = structs[sdna_index]
+            field = 'name' if 'name' in fields else 'filepath'
+            offset, size = fields[field]
+            library = data[offset:offset + size].split(b'\x00')[0].decode('utf-8', errors='replace')
+            if library != '':
+                links.append(self.resolve(file_path, library))
+        return links
+
+
+    # returns {field name: (offset, size)} for each struct
+    def parse_dna(self, dna, endian, pointer_size):
+        def read_strings(pos, count):
+            strings = []
+            for i in range(count):
+                end = dna.index(b'\x00', pos)
+                strings.append(dna[pos:end].decode('latin-1'))
+                pos = end + 1
+            return strings, (pos + 3) & ~3
+
+        pos = 8
+        count = struct.unpack_from(endian + 'i', dna, pos)[0]
+        names, pos = read_strings(pos + 4, count)
+        count = struct.unpack_from(endian + 'i', dna, pos + 4)[0]
+        types, pos = read_strings(pos + 8, count)
+        lengths = struct.unpack_from(endian + f'{len(types)}H', dna, pos + 4)
+        pos = (pos + 4 + 2 * len(types) + 3) & ~3
+        count = struct.unpack_from(endian + 'i', dna, pos + 4)[0]
+        pos += 8
+
+        structs = []
+        for i in range(count):
+            _, field_count = struct.unpack_from(endian + '2h', dna, pos)
+            pos += 4
+            fields = {}
+            offset = 0
+            for j in range(field_count):
+                type_index, name_index = struct.unpack_from(endian + '2h', dna, pos)
+                pos += 4
+                name = names[name_index]
+                size = pointer_size if '*' in name else lengths[type_index]
+                for dimension in re.findall(r'\[(\d+)\]', name):
+                    size *= int(dimension)
+                fields[re.sub(r'\[\d+\]', '', name)] = (offset, size)
+                offset += size
+            structs.append(fields)
+        return structs
+
+
+    # library paths starting with // are relative to the linking file
+    def resolve(self, file_path, library):
+        if library.startswith('//'):
+            library = os.path.join(os.path.dirname(file_path), library[2:])
+        return os.path.normpath(library.replace('\\', os.path.sep).replace('/', os.path.sep))
+
+
+    # direct links of a file, None if unknown
+    def get_links(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return []
+        with self.lock:
+            cached = self.links.get(file_path)
+        if (cached is not None) and (cached[0] == stat.st_size) and (cached[1] == stat.st_mtime_ns):
+            return cached[2]
+
+        try:
+            links = self.read_links(file_path)
+        except (OSError, ImportError, EOFError, ValueError, IndexError, KeyError, struct.error) as error:
+            logging.warning(f'Node {sxglobals.ip_addr}: Could not read library links of {file_path}: {error}')
+            links = None
+        with self.lock:
+            self.links[file_path] = [stat.st_size, stat.st_mtime_ns, links]
+        return links
+
+
+    # reads the links of all files and of the libraries they reach
+    def build(self, file_paths):
+        self.load()
+        pending = set(file_paths)
+        visited = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+            while len(pending) > 0:
+                visited.update(pending)
+                results = list(executor.map(self.get_links, pending))
+                pending = set(library for links in results if links is not None for library in links) - visited
+        self.save()
+
+
+    # transitive libraries of a file
+    def get_libraries(self, file_path):
+        self.load()
+        libraries = set()
+        stack = [file_path]
+        while len(stack) > 0:
+            current = stack.pop()
+            links = self.get_links(current)
+            if links is None:
+                # the links of unreadable files are unknown, they are their own dependency
+                libraries.add(current)
+                continue
+            for library in links:
+                if (library not in libraries) and (library != file_path):
+                    libraries.add(library)
+                    stack.append(library)
+        return sorted(libraries)
+
+
+    # content hash of the transitive libraries of a file
+    def get_stamp(self, file_path):
+        fingerprints.load()
+        stamp = hashlib.sha256()
+        for library in self.get_libraries(file_path):
+            stamp.update(library.encode('utf-8'))
+            stamp.update(fingerprints.hash_file(library).encode('utf-8'))
+        return stamp.hexdigest()
+
+
+    def get_asset_path(self, asset):
+        return os.path.join(os.path.split(sxglobals.catalogue_path)[0].replace('//', os.path.sep), asset.replace('//', os.path.sep))
+
+
+    # Returns the catalogue assets whose linked libraries changed since their last export.
+    # Assets without a stamp are recorded as current, like a new revision store.
+    def get_changed_assets(self):
+        assets = set(asset for category in sxglobals.catalogue for asset in sxglobals.catalogue[category])
+        self.build([self.get_asset_path(asset) for asset in assets])
+        stamps = revision_store.get_stamps()
+
+        changed = set()
+        new_stamps = {}
+        for asset in assets:
+            stamp = self.get_stamp(self.get_asset_path(asset))
+            if asset not in stamps:
+                new_stamps[asset] = stamp
+            elif stamps[asset] != stamp:
+                changed.add(asset)
+        if len(new_stamps) > 0:
+            revision_store.set_stamps(new_stamps)
+        fingerprints.save()
+        self.save()
+
+        if len(changed) > 0:
+            logging.info(f'Linked libraries changed in {sorted(changed)}')
+        return changed
+
+
+# ------------------------------------------------------------------------
+#    Revision Store
+#    Exported revisions and library stamps of catalogue assets are kept
+#    in file_revisions.db in the export folder. Each asset is updated in
+#    its own transaction once all of its tasks have succeeded.
+#    file_revisions.json is imported into a new store and written after
+#    each job for tools that read it.
+# ------------------------------------------------------------------------
+class SXBATCHER_revision_store(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connection = None
+        self.db_path = None
+        self.expected = {}
+        self.failed = set()
+        self.job_revisions = {}
+        self.changed = False
+
+
+    def get_path(self, extension='db'):
+        return os.path.join(sxglobals.export_path, f'file_revisions.{extension}')
+
+
+    # reopens when the export folder has changed, call with the lock held
+    def connect(self):
+        if (self.connection is not None) and (self.db_path == self.get_path()):
+            return self.connection
+        if self.connection is not None:
+            self.connection.close()
+
+        self.db_path = self.get_path()
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS revisions (asset TEXT PRIMARY KEY, revision INTEGER NOT NULL DEFAULT -1, stamp TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS object_revisions (asset TEXT, object TEXT, revision INTEGER NOT NULL, PRIMARY KEY (asset, object))')
+        if self.connection.execute('SELECT COUNT(*) FROM revisions').fetchone()[0] == 0:
+            self.import_json()
+        return self.connection
+
+
+    # a new store starts from file_revisions.json, or from the catalogue if there is none
+    def import_json(self):
+        if os.path.isfile(self.get_path('json')):
+            revisions = init.load_json(self.get_path('json'))
+            logging.info(f'Node {sxglobals.ip_addr}: Importing {self.get_path("json")}')
+        else:
+            logging.info(f'Node {sxglobals.ip_addr}: No revision data found, new revisions are stored in {self.db_path}')
+            revisions = manager.get_revisions(all=True)
+        stamp_path = os.path.join(sxglobals.export_path, 'file_dependencies.json')
+        stamps = init.load_json(stamp_path) if os.path.isfile(stamp_path) else {}
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO revisions (asset, revision, stamp) VALUES (?, ?, ?)',
+                [(asset, int(revisions.get(asset, -1)), stamps.get(asset)) for asset in set(revisions) | set(stamps)])
+        self.changed = True
+
+
+    def export_json(self):
+        with self.lock:
+            if not self.changed:
+                return
+            rows = self.connect().execute('SELECT asset, revision FROM revisions WHERE revision >= 0').fetchall()
+            self.changed = False
+        init.save_json(self.get_path('json'), {asset: str(revision) for asset, revision in rows})
+
+
+    def get_revision(self, asset):
+        with self.lock:
+            row = self.connect().execute('SELECT revision FROM revisions WHERE asset = ?', (asset, )).fetchone()
+        return -1 if row is None else row[0]
+
+
+    def get_object_revisions(self, asset):
+        with self.lock:
+            rows = self.connect().execute('SELECT object, revision FROM object_revisions WHERE asset = ?', (asset, )).fetchall()
+        return dict(rows)
+
+
+    def get_stamps(self):
+        with self.lock:
+            rows = self.connect().execute('SELECT asset, stamp FROM revisions WHERE stamp IS NOT NULL').fetchall()
+        return dict(rows)
+
+
+    # stamps of assets without an exported revision are stored with revision -1
+    def set_stamps(self, stamps):
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.executemany(
+                    'INSERT INTO revisions (asset, stamp) VALUES (?, ?) ON CONFLICT(asset) DO UPDATE SET stamp = excluded.stamp',
+                    list(stamps.items()))
+
+
+    # records the exported revisions and current library stamp of one asset
+    def update(self, asset, revision, object_revisions):
+        stamp = dependencies.get_stamp(dependencies.get_asset_path(asset))
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    'INSERT INTO revisions (asset, revision, stamp) VALUES (?, ?, ?) ON CONFLICT(asset) DO UPDATE SET revision = excluded.revision, stamp = excluded.stamp',
+                    (asset, int(revision), stamp))
+                connection.executemany(
+                    'INSERT OR REPLACE INTO object_revisions (asset, object, revision) VALUES (?, ?, ?)',
+                    [(asset, obj, int(obj_revision)) for obj, obj_revision in object_revisions.items()])
+            self.changed = True
+
+
+    # returns the file revision and per-object revisions of a catalogue asset
+    def get_catalogue_revision(self, asset):
+        for category in sxglobals.catalogue:
+            if asset in sxglobals.catalogue[category]:
+                obj_dict = sxglobals.catalogue[category][asset]
+                return obj_dict.get('revision', str(0)), obj_dict.get('object_revisions', {})
+        return None, {}
+
+
+    # Counts the tasks of each asset in a local batch, including those that are
+    # skipped or restored. Assets are updated when all of their tasks have finished.
+    def begin(self, tasks):
+        paths = {dependencies.get_asset_path(asset): asset for category in sxglobals.catalogue for asset in sxglobals.catalogue[category]}
+        with self.lock:
+            self.expected = {}
+            self.failed = set()
+            self.job_revisions = {}
+            for task in tasks:
+                asset = paths.get(task['source_file'])
+                if asset is not None:
+                    self.expected[task['source_file']] = self.expected.get(task['source_file'], 0) + 1
+                    self.job_revisions[task['source_file']] = (asset, ) + self.get_catalogue_revision(asset)
+
+
+    # completion hook, only tasks counted by begin are recorded
+    def task_done(self, result):
+        source_file = result['task']['source_file']
+        with self.lock:
+            if source_file not in self.expected:
+                return
+            if result['error'] is not None:
+                self.failed.add(source_file)
+            self.expected[source_file] -= 1
+            if self.expected[source_file] > 0:
+                return
+            del self.expected[source_file]
+            asset, revision, object_revisions = self.job_revisions.pop(source_file)
+            if source_file in self.failed:
+                return
+        if revision is not None:
+            self.update(asset, revision, object_revisions)
+
+
+# ------------------------------------------------------------------------
+#    Export Artifact Cache
+#    Outputs of successful tasks are stored by content hash under the
+#    task fingerprint. A task with a cached fingerprint is restored into
+#    its export folder instead of launching Blender. The least recently
+#    used entries are evicted above the size limit.
+# ------------------------------------------------------------------------
+class SXBATCHER_artifact_cache(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.pending = {}
+        self.deferred = []
+
+
+    def get_root(self):
+        root = sxglobals.cache_root if sxglobals.cache_root != '' else os.path.dirname(os.path.realpath(__file__))
+        return os.path.join(root, 'sx_cache')
+
+
+    def get_blob_path(self, blob):
+        return os.path.join(self.get_root(), 'objects', blob[:2], blob)
+
+
+    # index entries are {fingerprint: {'files': [[relative path, blob, size], ...], 'used': time}}
+    def load(self):
+        with self.lock:
+            if self.index is None:
+                index_path = os.path.join(self.get_root(), 'index.json')
+                self.index = init.load_json(index_path) if os.path.isfile(index_path) else {}
+
+
+    def save(self):
+        with self.lock:
+            if self.index is not None:
+                os.makedirs(self.get_root(), exist_ok=True)
+                init.save_json(os.path.join(self.get_root(), 'index.json'), self.index)
+
+
+    # returns the entry of a fingerprint if all of its outputs are present
+    def get_entry(self, fingerprint):
+        self.load()
+        with self.lock:
+            entry = self.index.get(fingerprint)
+            if (entry is None) or not all(os.path.isfile(self.get_blob_path(blob)) for _, blob, _ in entry['files']):
+                return None
+            entry['used'] = time.time()
+            return entry
+
+
+    # Returns the tasks that were not found in the cache. With the cache service,
+    # tasks that another batcher is exporting are deferred to collect_deferred,
+    # the rest are claimed for this batcher unless claim is False.
+    def restore(self, tasks, claim=True):
+        if len(tasks) == 0:
+            return tasks
+        missed = []
+        restored = 0
+        for task, fingerprint in zip(tasks, fingerprints.get_fingerprints(tasks)):
+            entry = self.get_entry(fingerprint) if sxglobals.use_cache else None
+            if (entry is not None) and self.restore_entry(entry, task['export_path']):
+                status = 'hit'
+            elif sxglobals.cache_server != '':
+                status = cache_client.get(fingerprint, task['export_path'], claim=claim)
+            else:
+                status = 'miss'
+
+            if status == 'hit':
+                restored += 1
+                batch_local.task_reused(task)
+                logging.debug(f'Node {sxglobals.ip_addr}: {task["source_file"]} restored from cache')
+            elif (status == 'pending') and claim:
+                self.deferred.append((task, fingerprint))
+            else:
+                if claim:
+                    self.pending[fingerprints.get_key(task)] = fingerprint
+                missed.append(task)
+        logging.info(f'Node {sxglobals.ip_addr}: {restored} of {len(tasks)} tasks restored from cache, {len(self.deferred)} in progress elsewhere')
+        if sxglobals.use_cache:
+            self.save()
+        return missed
+
+
+    # waits for tasks exported by other batchers, returns those left for this batcher
+    def collect_deferred(self):
+        deferred, self.deferred = self.deferred, []
+        if len(deferred) == 0:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, len(deferred))) as executor:
+            statuses = list(executor.map(lambda item: cache_client.get(item[1], item[0]['export_path'], claim=True, wait=sxglobals.cache_claim_timeout), deferred))
+
+        retry = []
+        for (task, fingerprint), status in zip(deferred, statuses):
+            if status == 'hit':
+                batch_local.task_reused(task)
+            else:
+                self.pending[fingerprints.get_key(task)] = fingerprint
+                retry.append(task)
+        logging.info(f'Node {sxglobals.ip_addr}: {len(deferred) - len(retry)} of {len(deferred)} tasks exported elsewhere')
+        return retry
+
+
+    # outputs are hardlinked from the cache where possible, copied otherwise
+    def restore_entry(self, entry, export_path):
+        try:
+            for relative_path, blob, _ in entry['files']:
+                target_path = os.path.join(export_path, relative_path)
+                temp_path = target_path + '.sx_tmp'
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                try:
+                    os.link(self.get_blob_path(blob), temp_path)
+                except OSError:
+                    shutil.copy2(self.get_blob_path(blob), temp_path)
+                init.replace_if_changed(temp_path, target_path)
+        except OSError as error:
+            logging.warning(f'Node {sxglobals.ip_addr}: Cache restore to {export_path} failed: {error}')
+            return False
+        return True
+
+
+    # blobs are named by content, the fingerprint cache is not used as
+    # the cache service stores files without loading fingerprints
+    def hash_blob(self, file_path):
+        blob_hash = hashlib.sha256()
+        with open(file_path, 'rb') as input:
+            while chunk := input.read(1024 * 1024):
+                blob_hash.update(chunk)
+        return blob_hash.hexdigest()
+
+
+    # moves received files into the cache, outputs of local tasks are copied
+    def add_blob(self, file_path, move=False):
+        blob = self.hash_blob(file_path)
+        blob_path = self.get_blob_path(blob)
+        if not os.path.isfile(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if move:
+                os.replace(file_path, blob_path)
+            else:
+                shutil.copy2(file_path, blob_path + '.sx_tmp')
+                os.replace(blob_path + '.sx_tmp', blob_path)
+        return blob
+
+
+    # files are [relative path, file path] pairs
+    def add_entry(self, fingerprint, files, move=False):
+        self.load()
+        entry_files = []
+        for relative_path, file_path in files:
+            blob = self.add_blob(file_path, move)
+            entry_files.append([relative_path, blob, os.path.getsize(self.get_blob_path(blob))])
+
+        if len(entry_files) > 0:
+            with self.lock:
+                self.index[fingerprint] = {'files': entry_files, 'used': time.time()}
+            self.evict()
+
+
+    # relative paths of the outputs below the export folder of a task
+    def get_output_files(self, export_path, outputs):
+        files = []
+        for output in outputs:
+            relative_path = os.path.relpath(output, export_path)
+            if not relative_path.startswith('..') and os.path.isfile(output):
+                files.append([relative_path.replace(os.path.sep, '/'), output])
+        return files
+
+
+    # drops least recently used entries until the referenced outputs fit the size limit
+    def evict(self):
+        with self.lock:
+            blob_sizes = {blob: size for entry in self.index.values() for _, blob, size in entry['files']}
+            total = sum(blob_sizes.values())
+            for fingerprint in sorted(self.index.keys(), key=lambda key: self.index[key]['used']):
+                if total <= sxglobals.cache_size * 1024 * 1024:
+                    break
+                del self.index[fingerprint]
+                referenced = set(blob for entry in self.index.values() for _, blob, _ in entry['files'])
+                for blob in [blob for blob in blob_sizes.keys() if blob not in referenced]:
+                    total -= blob_sizes.pop(blob)
+                    try:
+                        os.remove(self.get_blob_path(blob))
+                    except OSError:
+                        pass
+
+
+    # completion hook, caches the outputs reported by the work script
+    def task_done(self, result):
+        task = result['task']
+        fingerprint = self.pending.pop(fingerprints.get_key(task), None)
+        outputs = sxglobals.task_outputs.pop(task['source_file'] if task.get('objects') is None else task['source_file'] + '|' + '|'.join(task['objects']), [])
+        if fingerprint is None:
+            return
+
+        files = self.get_output_files(task['export_path'], outputs) if result['error'] is None else []
+        if sxglobals.use_cache and (len(files) > 0):
+            try:
+                self.add_entry(fingerprint, files)
+            except OSError as error:
+                logging.warning(f'Node {sxglobals.ip_addr}: Could not cache outputs of {task["source_file"]}: {error}')
+        # an empty upload releases the claim for other batchers
+        if sxglobals.cache_server != '':
+            cache_client.put(fingerprint, files)
+
+
+# ------------------------------------------------------------------------
+#    Shared Cache Service
+#    Any batcher can serve its artifact cache to the farm over TCP.
+#    Each request is a JSON line, files follow as raw bytes:
+#      get  {'op', 'key', 'claim', 'wait'} -> {'status', 'files': [[path, size]]}
+#      put  {'op', 'key', 'files': [[path, size]]} -> {'status'}
+#    A claimed miss is exported by the claiming batcher only, others
+#    requesting the same key wait for its upload or for the claim to end.
+# ------------------------------------------------------------------------
+class SXBATCHER_cache_service(object):
+    def __init__(self):
+        self.claims = {}
+        self.condition = threading.Condition()
+
+
+    # returns hit, miss, claimed or pending
+    def lookup(self, key, claim, wait):
+        deadline = time.monotonic() + wait
+        with self.condition:
+            while True:
+                if artifact_cache.get_entry(key) is not None:
+                    return 'hit'
+                now = time.monotonic()
+                if self.claims.get(key, 0) < now:
+                    if claim:
+                        self.claims[key] = now + sxglobals.cache_claim_timeout
+                        return 'claimed'
+                    self.claims.pop(key, None)
+                    return 'miss'
+                if now >= deadline:
+                    return 'pending'
+                self.condition.wait(min(deadline, self.claims[key]) - now)
+
+
+    def release(self, key):
+        with self.condition:
+            self.claims.pop(key, None)
+            self.condition.notify_all()
+
+
+    def handle(self, conn, addr):
+        replied = False
+        with conn, conn.makefile('rb') as stream:
+            try:
+                request = json.loads(stream.readline())
+                key = request['key']
+                if request['op'] == 'get':
+                    status = self.lookup(key, request.get('claim', False), float(request.get('wait', 0)))
+                    entry = artifact_cache.get_entry(key) if status == 'hit' else None
+                    if entry is None:
+                        status = 'miss' if status == 'hit' else status
+                        conn.sendall((json.dumps({'status': status}) + '\n').encode('utf-8'))
+                    else:
+                        paths = [artifact_cache.get_blob_path(blob) for _, blob, _ in entry['files']]
+                        reply = {'status': 'hit', 'files': [[relative_path, os.path.getsize(path)] for (relative_path, _, _), path in zip(entry['files'], paths)]}
+                        conn.sendall((json.dumps(reply) + '\n').encode('utf-8'))
+                        replied = True
+                        self.send_files(conn, paths)
+                    logging.debug(f'Node {sxglobals.ip_addr}: Cache {status} for {addr[0]}')
+
+                elif request['op'] == 'put':
+                    try:
+                        if len(request['files']) > 0:
+                            os.makedirs(artifact_cache.get_root(), exist_ok=True)
+                            incoming = tempfile.mkdtemp(dir=artifact_cache.get_root())
+                            try:
+                                received = self.receive_files(stream, request['files'], incoming)
+                                artifact_cache.add_entry(key, list(zip([file[0] for file in request['files']], received)), move=True)
+                                artifact_cache.save()
+                            finally:
+                                shutil.rmtree(incoming, ignore_errors=True)
+                            logging.info(f'Node {sxglobals.ip_addr}: Cached {len(received)} files from Node {addr[0]}')
+                    finally:
+                        self.release(key)
+                    conn.sendall((json.dumps({'status': 'ok'}) + '\n').encode('utf-8'))
+                else:
+                    raise ValueError(f'Unknown cache operation {request["op"]}')
+            except Exception as error:
+                logging.error(f'Node {sxglobals.ip_addr}: Cache request from {addr[0]} failed: {error}')
+                # requesters always get a reply unless files were already being sent
+                if not replied:
+                    try:
+                        conn.sendall((json.dumps({'status': 'error'}) + '\n').encode('utf-8'))
+                    except OSError:
+                        pass
+
+
+    def send_files(self, sock, paths):
+        for path in paths:
+            with open(path, 'rb') as f:
+                while chunk := f.read(sxglobals.buffer_size * 16):
+                    sock.sendall(chunk)
+
+
+    # files are [relative path, size], returns the paths below target_dir,
+    # with keep_unchanged existing files identical to the received ones are not replaced
+    def receive_files(self, stream, files, target_dir, keep_unchanged=False):
+        written = []
+        for relative_path, size in files:
+            relative_path = os.path.normpath(relative_path)
+            if os.path.isabs(relative_path) or relative_path.startswith('..'):
+                raise ValueError(f'Invalid cache path {relative_path}')
+            target_path = os.path.join(target_dir, relative_path)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with open(target_path + '.sx_tmp', 'wb') as f:
+                left = int(size)
+                while left:
+                    chunk = stream.read(min(left, sxglobals.buffer_size * 16))
+                    if not chunk:
+                        raise OSError(f'Connection closed while receiving {relative_path}')
+                    left -= f.write(chunk)
+            if keep_unchanged:
+                init.replace_if_changed(target_path + '.sx_tmp', target_path)
+            else:
+                os.replace(target_path + '.sx_tmp', target_path)
+            written.append(target_path)
+        return written
+
+
+class SXBATCHER_cache_client(object):
+    def __init__(self):
+        # cleared on the first connection failure of a batch
+        self.available = True
+
+
+    def get_address(self):
+        host, _, port = sxglobals.cache_server.partition(':')
+        return (host, int(port) if port else sxglobals.cache_port)
+
+
+    # returns hit, miss, claimed or pending, an unreachable service is a miss
+    def get(self, key, export_path, claim=False, wait=0):
+        if not self.available:
+            return 'miss'
+        try:
+            with socket.create_connection(self.get_address(), timeout=10 + wait) as sock, sock.makefile('rb') as stream:
+                sock.sendall((json.dumps({'op': 'get', 'key': key, 'claim': claim, 'wait': wait}) + '\n').encode('utf-8'))
+                reply = json.loads(stream.readline())
+                if reply['status'] == 'hit':
+                    cache_service.receive_files(stream, reply['files'], export_path, keep_unchanged=True)
+                elif reply['status'] == 'error':
+                    logging.warning(f'Node {sxglobals.ip_addr}: Cache service {sxglobals.cache_server} could not handle the request')
+                    return 'miss'
+                return reply['status']
+        except OSError as error:
+            self.available = False
+            logging.warning(f'Node {sxglobals.ip_addr}: Cache service {sxglobals.cache_server} not available for this batch: {error}')
+            return 'miss'
+        except (ValueError, KeyError) as error:
+            logging.warning(f'Node {sxglobals.ip_addr}: Invalid reply from cache service {sxglobals.cache_server}: {error}')
+            return 'miss'
+
+
+    # files are [relative path, file path] pairs
+    def put(self, key, files):
+        if not self.available:
+            return False
+        try:
+            with socket.create_connection(self.get_address(), timeout=30) as sock, sock.makefile('rb') as stream:
+                request = {'op': 'put', 'key': key, 'files': [[relative_path, os.path.getsize(path)] for relative_path, path in files]}
+                sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+                cache_service.send_files(sock, [path for _, path in files])
+                return json.loads(stream.readline()).get('status') == 'ok'
+        except OSError as error:
+            self.available = False
+            logging.warning(f'Node {sxglobals.ip_addr}: Upload to cache service {sxglobals.cache_server} failed: {error}')
+            return False
+        except ValueError as error:
+            logging.warning(f'Node {sxglobals.ip_addr}: Upload to cache service {sxglobals.cache_server} failed: {error}')
+            return False
 
 
 # ------------------------------------------------------------------------
@@ -396,6 +1653,9 @@ class SXBATCHER_init(object):
 # ------------------------------------------------------------------------
 class SXBATCHER_batch_manager(object):
     def __init__(self):
+        self.node_lock = threading.Lock()
+        self.node_tasks = {}
+        self.changed_objects = {}
         return None
 
 
@@ -432,25 +1692,30 @@ class SXBATCHER_batch_manager(object):
 
 
     def get_source_assets(self, revisions_only=False, costs=False):
-        current_revisions = init.load_revision_data()
         new_revisions = {}
 
         # Also update catalogue in case of new revisions
         sxglobals.catalogue = init.load_asset_data(sxglobals.catalogue_path)
         sxglobals.active_category = sxglobals.active_category if sxglobals.active_category in sxglobals.catalogue else list(sxglobals.catalogue.keys())[0]
 
+        # dependents of changed libraries are exported with changed revisions
+        linked_changes = dependencies.get_changed_assets() if revisions_only else set()
+
         source_assets = []
         changed_assets = []
+        self.changed_objects = {}
         for obj in sxglobals.export_objs:
             for category in sxglobals.catalogue:
                 for asset, obj_dict in sxglobals.catalogue[category].items():
                     if obj in obj_dict['objects']:
                         if revisions_only:
                             revision = obj_dict.get('revision', str(0))
-                            if int(current_revisions.get(asset, '-1')) < int(revision):
+                            if (revision_store.get_revision(asset) < int(revision)) or (asset in linked_changes):
                                 new_revisions[asset] = revision
                                 source_assets.append((asset, int(obj_dict['cost'])))
                                 changed_assets.append(asset)
+                                if asset not in linked_changes:
+                                    self.changed_objects[asset] = self.get_changed_objects(asset, obj_dict)
                         else:
                             source_assets.append((asset, int(obj_dict['cost'])))
 
@@ -476,6 +1741,94 @@ class SXBATCHER_batch_manager(object):
             return source_files
 
 
+    # Returns the roots of the hierarchies with objects whose revision is newer than
+    # their last export, None when the whole file has to be exported
+    def get_changed_objects(self, asset, obj_dict):
+        object_revisions = obj_dict.get('object_revisions', {})
+        exported = revision_store.get_object_revisions(asset)
+        if (len(object_revisions) == 0) or (len(exported) == 0):
+            return None
+        changed = [obj for obj, revision in object_revisions.items() if int(revision) > exported.get(obj, -1)]
+        # objects added after cataloguing are not known to the batcher
+        if (len(changed) == 0) or (len(changed) == len(obj_dict['objects'])) or any(obj not in obj_dict['objects'] for obj in changed):
+            return None
+        # the work script exports listed objects with their children, so a changed
+        # child is exported through its root, files without parent data are exported whole
+        parents = obj_dict.get('object_parents')
+        if parents is None:
+            return None
+        roots = list(dict.fromkeys(self.get_root(obj, parents) for obj in changed))
+        if set(roots) >= set(self.get_root(obj, parents) for obj in obj_dict['objects']):
+            return None
+        logging.info(f'Node {sxglobals.ip_addr}: {asset} changed objects {changed} in {roots}')
+        return roots
+
+
+    # Splits files above shard_cost into shards of their root hierarchies, one shard
+    # per shard_cost and at most one per core. Cost is divided by catalogue object count.
+    # Files catalogued without their object parents are not split.
+    # Returns (asset, cost, roots) sorted by cost, roots is None for whole files.
+    def shard_assets(self, source_assets, num_cores):
+        asset_objects = {}
+        asset_parents = {}
+        for category in sxglobals.catalogue:
+            for asset, obj_dict in sxglobals.catalogue[category].items():
+                asset_objects[asset] = obj_dict['objects']
+                asset_parents[asset] = obj_dict.get('object_parents')
+
+        shards = []
+        for asset, cost in source_assets:
+            objects = asset_objects.get(asset, [])
+            groups = self.get_root_groups(objects, asset_parents[asset]) if asset_parents.get(asset) is not None else {}
+            # files with changed objects only export their hierarchies, at their share of the cost
+            changed = self.changed_objects.get(asset)
+            if changed is not None:
+                groups = {root: groups.get(root, [root]) for root in changed}
+                cost = max(1, cost * sum(len(group) for group in groups.values()) // max(1, len(objects)))
+            object_count = sum(len(group) for group in groups.values())
+            shard_count = min(len(groups), -(-cost // sxglobals.shard_cost), max(1, num_cores)) if sxglobals.shard_cost > 0 else 1
+            if shard_count < 2:
+                shards.append((asset, cost, changed))
+                continue
+            # whole hierarchies are assigned to the shard where their first object would fall
+            shard_roots = [[] for i in range(shard_count)]
+            shard_sizes = [0] * shard_count
+            assigned = 0
+            for root, group in groups.items():
+                index = assigned * shard_count // object_count
+                shard_roots[index].append(root)
+                shard_sizes[index] += len(group)
+                assigned += len(group)
+            shard_roots = [(roots, size) for roots, size in zip(shard_roots, shard_sizes) if len(roots) > 0]
+            if len(shard_roots) < 2:
+                shards.append((asset, cost, changed))
+                continue
+            for roots, size in shard_roots:
+                shards.append((asset, max(1, cost * size // object_count), roots))
+            logging.info(f'Node {sxglobals.ip_addr}: {asset} split into {len(shard_roots)} shards')
+
+        shards.sort(key=lambda x: x[1], reverse=True)
+        return shards
+
+
+    # topmost parent of an object, parents are {object: parent}
+    def get_root(self, obj, parents):
+        root = obj
+        visited = set()
+        while (root in parents) and (root not in visited):
+            visited.add(root)
+            root = parents[root]
+        return root
+
+
+    # objects grouped by their root, in catalogue order
+    def get_root_groups(self, objects, parents):
+        groups = {}
+        for obj in objects:
+            groups.setdefault(self.get_root(obj, parents), []).append(obj)
+        return groups
+
+
     def get_revisions(self, all=False):
         source_assets = []
         for category in sxglobals.catalogue:
@@ -493,14 +1846,6 @@ class SXBATCHER_batch_manager(object):
         return revision_dict
 
 
-    def update_revisions(self):
-        revision_path = sxglobals.export_path + os.path.sep + 'file_revisions.json'
-        file_dict = init.load_revision_data()
-        data_dict = self.get_revisions()
-        file_dict.update(data_dict)
-        init.save_json(revision_path, file_dict)
-
-
     def finish_task(self, reset=False):
         if reset:
             if sxglobals.revision_export:
@@ -509,7 +1854,7 @@ class SXBATCHER_batch_manager(object):
                 label_string = 'Could not start batch, check node settings'
         else:
             if sxglobals.master_node is None:
-                self.update_revisions()
+                revision_store.export_json()
 
             if len(sxglobals.errors) > 0:
                 label_string = 'Job completed in '+str(round(sxglobals.now-sxglobals.then, 2))+' seconds\n'
@@ -522,6 +1867,17 @@ class SXBATCHER_batch_manager(object):
                 label_string = 'Job completed in '+str(round(sxglobals.now-sxglobals.then, 2))+' seconds'
                 logging.info(f'Node {sxglobals.ip_addr}: {label_string}')
 
+            if sxglobals.outputs_changed + sxglobals.outputs_unchanged > 0:
+                logging.info(f'Node {sxglobals.ip_addr}: {sxglobals.outputs_changed} outputs changed, {sxglobals.outputs_unchanged} unchanged')
+                label_string += f'\n{sxglobals.outputs_changed} outputs changed, {sxglobals.outputs_unchanged} unchanged'
+
+            if len(sxglobals.task_reports) > 0:
+                label_string += '\nKilled and retried:\n'
+                for file, report in sxglobals.task_reports.items():
+                    label_string += f'{os.path.basename(file)} ({report["attempts"]} attempts)\n'
+                    for reason in report['kills']:
+                        logging.warning(f'Node {sxglobals.ip_addr}: {file} killed, {reason}')
+
         if not sxglobals.headless:
             gui.state_manager('ready', label=label_string)
         sxglobals.errors = []
@@ -529,18 +1885,19 @@ class SXBATCHER_batch_manager(object):
         sxglobals.master_node = None
         sxglobals.remote_assignment = []
 
-        if sxglobals.share_cpus:
-           init.reset_batch_folders()
+        if sxglobals.remote_job is not None:
+            scratch.release(sxglobals.remote_job)
+            sxglobals.remote_job = None
 
 
-    def benchmark(self):
+    def get_benchmark_task(self, threads, export_path):
         script_dir = os.path.dirname(os.path.realpath(__file__))
-        benchmark_task = {
+        return {
             'blender_path': sxglobals.blender_path,
             'source_file': str(os.path.join(script_dir, 'perf_test.blend')),
             'script_path': str(os.path.join(script_dir, 'sx2_batch.py')),
             'sxtools_addon_path': os.path.abspath(sxglobals.sxtools_addon_path),
-            'export_path': str(os.path.join(script_dir, 'batch_results')),
+            'export_path': export_path,
             'sxtools_path': os.path.abspath(sxglobals.sxtools_path),
             'export_format': 'FBX',
             'subdivision': '3',
@@ -548,8 +1905,14 @@ class SXBATCHER_batch_manager(object):
             'static_vertex_colors': False,
             'collider_offset': False,
             'debug': False,
-            'threads': '0' if sxglobals.shared_cores == multiprocessing.cpu_count() else '1'
+            'threads': str(threads)
         }
+
+
+    def benchmark(self):
+        script_dir = os.path.dirname(os.path.realpath(__file__))
+        job_id = scratch.new_job('benchmark')
+        benchmark_task = self.get_benchmark_task(batch_local.get_thread_count(0, 0, sxglobals.shared_cores if sxglobals.shared_cores > 0 else multiprocessing.cpu_count()), scratch.get_dir(job_id, 'results'))
         try:
             logging.info(f'Node {sxglobals.ip_addr} running performance benchmark with threads {benchmark_task["threads"]}')
             then = time.perf_counter()
@@ -559,13 +1922,99 @@ class SXBATCHER_batch_manager(object):
             now = time.perf_counter()
             logging.info(f'Node {sxglobals.ip_addr} benchmark result {now-then: .2f} seconds') 
             sxglobals.performance_index = round(now-then, 2)
-            init.reset_batch_folders()
             conf_dict = init.load_conf()
             conf_dict['performance_index'] = str(sxglobals.performance_index)
             conf_path = os.path.join(script_dir, 'sx_conf.json')
             init.save_json(conf_path, conf_dict)
         except OSError:
             sxglobals.performance_index = 0
+        scratch.release(job_id)
+
+
+    # Runs a measurement batch without sessions, returns the wall time in seconds
+    # or None if any task failed. Tasks carry a fixed thread count, results are discarded.
+    def run_benchmark_batch(self, tasks, num_cores):
+        job_id = scratch.new_job('benchmark')
+        tasks = [dict(task, export_path=scratch.get_dir(job_id, 'results')) for task in tasks]
+        sessions = sxglobals.blender_sessions
+        sxglobals.blender_sessions = False
+        sxglobals.errors = []
+        sxglobals.tasks_done = 0
+        sxglobals.tasks_total = len(tasks)
+        sxglobals.then = time.perf_counter()
+        SXBATCHER_supervisor(num_cores).run(tasks)
+        batch_local.flush_hooks()
+        seconds = time.perf_counter() - sxglobals.then
+        sxglobals.blender_sessions = sessions
+        failed = len(sxglobals.errors) > 0
+        sxglobals.errors = []
+        scratch.release(job_id)
+        return None if failed else seconds
+
+
+    # Runs concurrent copies of the benchmark scene unpinned and pinned,
+    # one copy per NUMA node and at least two, and logs the throughput of both
+    def benchmark_affinity(self):
+        num_cores = sxglobals.shared_cores if sxglobals.shared_cores > 0 else multiprocessing.cpu_count()
+        copies = max(2, len(set(cpu_topology.nodes.values())))
+        benchmark_task = self.get_benchmark_task(max(1, num_cores // copies), None)
+
+        affinity = sxglobals.cpu_affinity
+        results = {}
+        for pinned in (False, True):
+            sxglobals.cpu_affinity = pinned
+            logging.info(f'Node {sxglobals.ip_addr} running {copies} {"pinned" if pinned else "unpinned"} benchmarks with threads {benchmark_task["threads"]}')
+            results[pinned] = self.run_benchmark_batch([dict(benchmark_task) for i in range(copies)], num_cores)
+        sxglobals.cpu_affinity = affinity
+
+        if None in results.values():
+            logging.error(f'Node {sxglobals.ip_addr} affinity benchmark failed')
+            return
+        elif not cpu_topology.is_supported():
+            logging.info(f'Node {sxglobals.ip_addr} affinity benchmark: pinning is not available on this system')
+        logging.info(f'Node {sxglobals.ip_addr} affinity benchmark: unpinned {copies * 60.0 / results[False]: .2f} files/min, pinned {copies * 60.0 / results[True]: .2f} files/min ({results[False] / results[True] - 1.0: +.1%})')
+
+
+    # Measures the throughput of each (Blender processes x threads) combination that fills the cores
+    # on the same workload: a sample of the selected assets, or copies of the benchmark scene.
+    # The fastest combination is stored for this hardware and used by later local batches.
+    def autotune(self):
+        num_cores = multiprocessing.cpu_count()
+        sample_size = min(16, num_cores)
+        if (sxglobals.export_objs is not None) and (len(sxglobals.export_objs) > 0):
+            # Sample runs must not record revisions or library stamps of the assets,
+            # so the whole selection is sampled regardless of revision export
+            tasks = self.get_catalogue_tasks(False)
+            # spread the sample over the cost range, tasks are sorted by cost
+            step = max(1.0, len(tasks) / sample_size)
+            workload = [tasks[int(i * step)] for i in range(min(sample_size, len(tasks)))]
+        else:
+            workload = [self.get_benchmark_task(1, None) for i in range(sample_size)]
+        if len(workload) == 0:
+            logging.error(f'Node {sxglobals.ip_addr} autotune: no source files found for the selection')
+            return
+
+        thread_counts = [threads for threads in (1, 2, 4, 8, 16, 32) if threads <= num_cores]
+        results = {}
+        for threads in thread_counts:
+            processes = max(1, num_cores // threads)
+            # the sample is repeated to a multiple of the process count so that every Blender is kept busy
+            batch_size = processes * -(-len(workload) // processes)
+            logging.info(f'Node {sxglobals.ip_addr} autotune: {batch_size} files, {processes} Blenders x {threads} threads')
+            seconds = self.run_benchmark_batch([dict(workload[i % len(workload)], threads=str(threads)) for i in range(batch_size)], processes * threads)
+            if seconds is None:
+                logging.error(f'Node {sxglobals.ip_addr} autotune: {processes} x {threads} failed')
+                continue
+            results[f'{processes}x{threads}'] = round(batch_size * 60.0 / seconds, 3)
+            logging.info(f'Node {sxglobals.ip_addr} autotune: {processes} x {threads} {results[f"{processes}x{threads}"]: .2f} files/min')
+
+        if len(results) == 0:
+            logging.error(f'Node {sxglobals.ip_addr} autotune failed')
+            return
+        best = max(results, key=results.get)
+        processes, threads = (int(value) for value in best.split('x'))
+        autotuner.store(processes, threads, results)
+        logging.info(f'Node {sxglobals.ip_addr} autotune: using {processes} Blenders x {threads} threads')
 
 
     # Handles task assignments:
@@ -585,42 +2034,58 @@ class SXBATCHER_batch_manager(object):
 
         sxglobals.node_busy_status = True
         sxglobals.then = time.perf_counter()
+        sxglobals.outputs_changed = 0
+        sxglobals.outputs_unchanged = 0
+        cache_client.available = True
 
         if remote_task:
             # Receive files to be processed from network node
             if sxglobals.share_cpus and (len(sxglobals.remote_assignment) > 0):
-                process_batch(self.prepare_received_tasks(), sxglobals.shared_cores)
+                process_batch(self.reuse_outputs(self.preflight(self.prepare_received_tasks()), incremental=False), sxglobals.shared_cores)
             else:
                 self.finish_task(reset=True)
 
         elif sxglobals.use_network_nodes:
             # Send files to be processed to network nodes
             if len(sxglobals.export_objs) > 0:
-                node_tasks = self.prepare_node_tasks()
-                # Track tasked nodes, check completions in file_listener_thread
+                node_tasks = {node_ip: task_list for node_ip, task_list in self.prepare_node_tasks().items() if len(task_list) > 0}
+                # Track tasked nodes, check completions in file_listener_thread.
+                # The master is tracked until its own share, including the shares
+                # of nodes that rejected or missed their transfer, has completed.
                 sxglobals.tasked_nodes = list(node_tasks.keys())
+                if sxglobals.ip_addr not in sxglobals.tasked_nodes:
+                    sxglobals.tasked_nodes.append(sxglobals.ip_addr)
+                own_share = node_tasks.pop(sxglobals.ip_addr, [])
                 for node_ip, task_list in node_tasks.items():
-                    if node_ip == sxglobals.ip_addr:
-                        node_ip = '127.0.0.1'
-                    # Submit files to node
+                    # revisions are recorded when the node completes and reports its failed files
+                    self.node_tasks[node_ip] = [{'source_file': dependencies.get_asset_path(task['asset'])} for task in task_list]
+                    # Submit files to node, shards of a file share one copy
                     source_files = []
                     for task in task_list:
                         file_path = task['asset']
                         file_path.replace('//', os.path.sep)
                         source_path = pathlib.Path(os.path.join(sxglobals.asset_path, file_path))
-                        source_files.append(source_path)
+                        if source_path not in source_files:
+                            source_files.append(source_path)
 
                     payload = []
                     for task in task_list:
-                        task['asset'] = os.path.basename(task['asset'])
-                        task['batch_size'] = str(len(task_list))
-                        payload.append(task)
+                        payload.append(dict(task, asset=os.path.basename(task['asset']), batch_size=str(len(task_list))))
 
-                    if len(source_files) > 0:
-                        if init.transfer_files((node_ip, sxglobals.file_transfer_port), (payload, source_files)):
-                            logging.info(f'{len(source_files)} source files transferred to Node {node_ip}')
-                        else:
-                            self.finish_task(reset=True)
+                    status = init.transfer_files((node_ip, sxglobals.file_transfer_port), (payload, source_files))
+                    if status == 'ok':
+                        logging.info(f'{len(source_files)} source files transferred to Node {node_ip}')
+                    else:
+                        logging.warning(f'Node {node_ip} transfer {status}, processing its {len(task_list)} files locally')
+                        with self.node_lock:
+                            sxglobals.tasked_nodes.remove(node_ip)
+                        self.node_tasks.pop(node_ip, None)
+                        own_share += task_list
+
+                if len(own_share) > 0:
+                    self.process_own_share(own_share)
+                else:
+                    self.node_completed(sxglobals.ip_addr)
             else:
                 self.finish_task(reset=True)
 
@@ -628,22 +2093,164 @@ class SXBATCHER_batch_manager(object):
             # Receive export list created in the UI
             if len(sxglobals.export_objs) > 0:
                 logging.info(f'Processing {len(sxglobals.export_objs)} export objects')
-                process_batch(self.prepare_local_tasks(), multiprocessing.cpu_count())
+                process_batch(self.reuse_outputs(self.preflight(self.prepare_local_tasks())), multiprocessing.cpu_count())
             else:
                 self.finish_task(reset=True)
 
 
+    # Rejects tasks that would fail after Blender has started: unreadable sources,
+    # unknown palettes or export formats, missing library and unwritable or full export folders.
+    # Rejected files are added to sxglobals.errors.
+    def preflight(self, tasks):
+        if len(tasks) == 0:
+            return tasks
+
+        then = time.perf_counter()
+        library_paths = set(task['sxtools_path'] for task in tasks)
+        export_paths = set(task['export_path'] for task in tasks)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(tasks) + len(library_paths) + len(export_paths))) as executor:
+            palettes = dict(zip(library_paths, executor.map(self.get_library_palettes, library_paths)))
+            export_errors = dict(zip(export_paths, executor.map(self.check_export_path, export_paths)))
+            errors = list(executor.map(lambda task: self.check_task(task, palettes[task['sxtools_path']], export_errors[task['export_path']]), tasks))
+
+        accepted = []
+        for task, error in zip(tasks, errors):
+            if error is None:
+                accepted.append(task)
+            else:
+                logging.error(f'Node {sxglobals.ip_addr}: Preflight rejected {os.path.basename(task["source_file"])}: {error}')
+                sxglobals.errors.append(task['source_file'])
+        logging.debug(f'Node {sxglobals.ip_addr}: Preflight checked {len(tasks)} tasks in {time.perf_counter() - then: .3f} seconds')
+        return accepted
+
+
+    # palette names of the SX Tools library, None if the library is missing
+    def get_library_palettes(self, sxtools_path):
+        palette_path = os.path.join(sxtools_path, 'sxpalettes.json')
+        if not os.path.isfile(palette_path):
+            return None
+        palettes = set()
+        for category, category_palettes in init.load_json(palette_path).items():
+            palettes.add(category)
+            if isinstance(category_palettes, dict):
+                palettes.update(category_palettes.keys())
+        return palettes
+
+
+    def check_export_path(self, export_path):
+        try:
+            os.makedirs(export_path, exist_ok=True)
+        except OSError as error:
+            return f'export folder {export_path} cannot be created: {error}'
+        if not os.access(export_path, os.W_OK):
+            return f'export folder {export_path} is not writable'
+        free = shutil.disk_usage(export_path).free // (1024 * 1024)
+        if free < sxglobals.min_free_space:
+            return f'{free} MB free in {export_path}'
+        return None
+
+
+    def check_task(self, task, palettes, export_error):
+        source_file = task['source_file']
+        try:
+            with open(source_file, 'rb') as blend:
+                header = blend.read(7)
+        except OSError as error:
+            return f'source file cannot be read: {error}'
+        # uncompressed, gzip or zstd compressed blend files
+        if not (header.startswith(b'BLENDER') or header.startswith(b'\x1f\x8b') or header.startswith(b'\x28\xb5\x2f\xfd')):
+            return 'not a Blender file'
+        if export_error is not None:
+            return export_error
+        if not os.path.isdir(task['sxtools_path']):
+            return f'SX Tools library folder {task["sxtools_path"]} not found'
+        # each variant overrides the task settings
+        settings = [(task['palette'], task['export_format'])]
+        for variant in task.get('variants') or []:
+            if 'name' not in variant:
+                return 'export variant without a name'
+            settings.append((variant.get('palette', task['palette']), variant.get('format', task['export_format'])))
+        for palette, export_format in settings:
+            if (palette is not None) and (palettes is None):
+                return f'sxpalettes.json not found in {task["sxtools_path"]}'
+            if (palette is not None) and (palette not in palettes):
+                return f'palette {palette} not found in the SX Tools library'
+            if (export_format is not None) and (export_format.lower() not in ('default', 'fbx', 'gltf')):
+                return f'invalid export format {export_format}'
+        return None
+
+
+    # The master's share of a distributed batch runs in place from the asset folder into the export folder.
+    # It completes like any other tasked node.
+    def process_own_share(self, task_list):
+        source_files = [(dependencies.get_asset_path(task['asset']), int(task['cost']), task['objects']) for task in task_list]
+        tasks = self.reuse_outputs(self.preflight(self.get_local_tasks(source_files)))
+        num_cores = init.get_shared_cores() if init.get_shared_cores() > 0 else multiprocessing.cpu_count()
+        logging.info(f'Node {sxglobals.ip_addr}: Processing {len(tasks)} files of its own share locally')
+
+        def process_share():
+            batch_local.worker_spawner(tasks, num_cores)
+            self.node_completed(sxglobals.ip_addr)
+
+        t = threading.Thread(target=process_share)
+        t.start()
+
+
+    # failed are the file names of the assets the node could not export
+    def node_completed(self, address, failed=()):
+        with self.node_lock:
+            if address not in sxglobals.tasked_nodes:
+                return
+            sxglobals.tasked_nodes.remove(address)
+            remaining = len(sxglobals.tasked_nodes)
+        for task in self.node_tasks.pop(address, []):
+            error = task['source_file'] if os.path.basename(task['source_file']) in failed else None
+            if (error is not None) and (error not in sxglobals.errors):
+                sxglobals.errors.append(error)
+            revision_store.task_done({'task': task, 'error': error})
+        if len(failed) > 0:
+            logging.error(f'Node {address} completed tasks, {len(failed)} files failed')
+        else:
+            logging.info(f'Node {address} completed tasks')
+        if remaining == 0:
+            sxglobals.now = time.perf_counter()
+            logging.info(f'All nodes finished')
+            self.finish_task()
+
+
     def prepare_local_tasks(self):
+        tasks = self.get_catalogue_tasks(sxglobals.revision_export)
+        revision_store.begin(tasks)
+        return tasks
+
+
+    # tasks of the selected catalogue assets, without revision tracking
+    def get_catalogue_tasks(self, revisions_only):
         # grab blender work script from the location of this script
         asset_path = os.path.split(sxglobals.catalogue_path)[0].replace('//', os.path.sep)
 
         # get asset paths from catalogue, map to file system locations, remove doubles
-        source_assets = self.get_source_assets(sxglobals.revision_export)
+        source_assets = self.get_source_assets(revisions_only, costs=True)
 
-        source_files = [os.path.join(asset_path, asset.replace('//', os.path.sep)) for asset in source_assets]
+        source_files = [(os.path.join(asset_path, asset.replace('//', os.path.sep)), cost, objects) for asset, cost, objects in self.shard_assets(source_assets, multiprocessing.cpu_count())]
         if len(source_files) > 0:
             logging.debug(f'\nNode {sxglobals.ip_addr} source files: {source_files}')
+        return self.get_local_tasks(source_files)
+
+
+    # Skips tasks whose inputs are unchanged since their last export and
+    # restores cached outputs. Node jobs are always new folders, so only the cache applies.
+    # Runs after preflight so that rejected tasks are never claimed on the cache service.
+    def reuse_outputs(self, tasks, incremental=True):
+        if incremental and sxglobals.incremental_export:
+            tasks = fingerprints.filter(tasks)
+        if sxglobals.use_cache or (sxglobals.cache_server != ''):
+            tasks = artifact_cache.restore(tasks)
+        return tasks
 
+
+    # source files are (path, cost, objects)
+    def get_local_tasks(self, source_files):
         # Generate task definition for each local headless Blender
         return [{
             'blender_path':sxglobals.blender_path,
@@ -658,19 +2265,21 @@ class SXBATCHER_batch_manager(object):
             'static_vertex_colors': sxglobals.static_vertex_colors,
             'collider_offset': str(sxglobals.collider_offset_value) if sxglobals.collider_offset else None,
             'debug': sxglobals.debug,
-            'threads': '0'
-        } for file in source_files]
+            'threads': None,
+            'cost': cost * max(1, len(sxglobals.export_variants)),
+            'objects': objects,
+            'variants': sxglobals.export_variants if len(sxglobals.export_variants) > 0 else None
+        } for file, cost, objects in source_files]
 
 
     def prepare_received_tasks(self):
-        # grab blender work script from the location of this script
-        script_dir = os.path.dirname(os.path.realpath(__file__))
+        # source files were received into the scratch job of this batch
         return [{
             'blender_path': sxglobals.blender_path,
-            'source_file': str(os.path.join(os.path.join(script_dir, 'batch_submissions'), remote_task['asset'])),
+            'source_file': str(os.path.join(scratch.get_dir(sxglobals.remote_job, 'submissions'), remote_task['asset'])),
             'script_path': sxglobals.script_path,
             'sxtools_addon_path': os.path.abspath(sxglobals.sxtools_addon_path),
-            'export_path': str(os.path.join(script_dir, 'batch_results')),
+            'export_path': scratch.get_dir(sxglobals.remote_job, 'results'),
             'sxtools_path': os.path.abspath(sxglobals.sxtools_path),
             'export_format': sxglobals.export_format,
             'subdivision': str(remote_task['subdivision_count']) if remote_task['subdivision'] == 'True' else None,
@@ -678,17 +2287,34 @@ class SXBATCHER_batch_manager(object):
             'static_vertex_colors': True if remote_task['static_vertex_colors'] == 'True' else False,
             'collider_offset': str(remote_task['collider_offset_value']) if remote_task['collider_offset'] == 'True' else None,
             'debug': True if remote_task['debug'] == 'True' else False,
-            'threads': '0' if sxglobals.shared_cores == multiprocessing.cpu_count() else '1'
+            'threads': None,
+            'cost': int(remote_task.get('cost', 0)) * max(1, len(remote_task.get('variants') or [])),
+            'objects': remote_task.get('objects'),
+            'variants': remote_task.get('variants')
         } for remote_task in sxglobals.remote_assignment]
 
 
+    # Cached outputs are restored on the master before distribution.
+    # Nothing is claimed, the nodes claim the tasks they are sent.
+    def restore_shards(self, shards, tasks):
+        missed = set(id(task) for task in artifact_cache.restore(tasks, claim=False))
+        return [shard for shard, task in zip(shards, tasks) if id(task) in missed]
+
+
     def prepare_node_tasks(self):
         source_assets = self.get_source_assets(sxglobals.revision_export, costs=True)
         tasks = []
         node_tasks = {}
 
         if len(source_assets) > 0:
-            for asset in source_assets:
+            farm_cores = sum(int(node[3]) for node in sxglobals.nodes)
+            shards = self.shard_assets(source_assets, farm_cores)
+            # revisions are recorded once all shards of an asset are exported or restored
+            shard_tasks = self.get_local_tasks([(dependencies.get_asset_path(asset), cost, objects) for asset, cost, objects in shards])
+            revision_store.begin(shard_tasks)
+            if sxglobals.use_cache or (sxglobals.cache_server != ''):
+                shards = self.restore_shards(shards, shard_tasks)
+            for asset in shards:
                 tasks.append({
                     "magic": sxglobals.magic_task,
                     "master": sxglobals.ip_addr,
@@ -703,15 +2329,18 @@ class SXBATCHER_batch_manager(object):
                     "collider_offset_value": str(sxglobals.collider_offset_value),
                     "debug": str(sxglobals.debug),
                     "batch_size": str(len(source_assets)),
-                    "cost": asset[1]
+                    "cost": asset[1],
+                    "objects": asset[2],
+                    "variants": sxglobals.export_variants if len(sxglobals.export_variants) > 0 else None
                 })
 
             logging.debug(f'Source asset count: {len(tasks)}')
 
             # Sort nodes by performance rating
+            # all shards may have been restored from the cache
             nodes = sxglobals.nodes[:]
-            if len(nodes) == 0:
-                return []
+            if (len(nodes) == 0) or (len(tasks) == 0):
+                return {}
 
             nodes.sort(key=lambda x: x[6])
 
@@ -745,7 +2374,7 @@ class SXBATCHER_batch_manager(object):
             elif method == 2:
                 # Cost based method: Divide tasks per node
                 total_cores = sum(int(node[3]) for node in nodes)
-                total_cost = sum(asset[1] for asset in source_assets)
+                total_cost = sum(task['cost'] for task in tasks)
                 logging.debug(f'Total cost: {total_cost}')
 
                 # Allocate work share
@@ -767,7 +2396,7 @@ class SXBATCHER_batch_manager(object):
                 best_perf = min(float(node[6]) for node in nodes) ** 3
                 bias_cores = [round(float(node[3]) * best_perf / (float(node[6]) ** 3)) for node in nodes]
                 total_cores = sum(bias_cores)
-                total_cost = sum(asset[1] for asset in source_assets)
+                total_cost = sum(task['cost'] for task in tasks)
                 cost_shares = [total_cost * float(num_cores) / float(total_cores) for num_cores in bias_cores]
 
                 # Allocate work share
@@ -796,76 +2425,224 @@ class SXBATCHER_batch_manager(object):
 # ------------------------------------------------------------------------
 class SXBATCHER_batch_local(object):
     def __init__(self):
+        self.pool = None
+        self.completion_hooks = []
+        self.hook_queue = queue.Queue()
+        self.hook_thread = None
         return None
 
 
-    # shim to expand keyword arguments
-    def shim(self, kwargs):
-        return self.worker_process(**kwargs)
+    # Hooks are called as hook(result) in completion order from a hook thread,
+    # so that hashing and uploads do not hold up the supervisor's event loop.
+    # Tasks reused before the batch starts call them directly.
+    def add_completion_hook(self, hook):
+        if hook not in self.completion_hooks:
+            self.completion_hooks.append(hook)
 
-    
-    def worker_process(self, *,
-        blender_path, source_file, script_path, sxtools_addon_path, export_path, sxtools_path, export_format, subdivision,
-        palette, static_vertex_colors, collider_offset, debug, threads):
 
-        batch_args = [blender_path, "--background", "--factory-startup", "--threads", threads, "-noaudio", source_file, "--python", script_path]
+    def remove_completion_hook(self, hook):
+        if hook in self.completion_hooks:
+            self.completion_hooks.remove(hook)
 
-        if debug:
-            batch_args.extend(["--debug"])
-        batch_args.extend(["--"])
-        batch_args.extend(["-sx", sxtools_addon_path])
-        batch_args.extend(["-x", export_path])
-        batch_args.extend(["-l", sxtools_path])
+
+    # tasks skipped as unchanged or restored from a cache complete without Blender
+    def task_reused(self, task):
+        self.call_hooks({'task': task, 'error': None, 'reused': True})
+
+
+    def call_hooks(self, result):
+        for hook in self.completion_hooks:
+            try:
+                hook(result)
+            except Exception as error:
+                logging.error(f'Node {sxglobals.ip_addr}: Completion hook failed for {result["task"]["source_file"]}: {error}')
+
+
+    def run_hooks(self):
+        while True:
+            result = self.hook_queue.get()
+            self.call_hooks(result)
+            self.hook_queue.task_done()
+
+
+    # waits until the hooks of all finished tasks have returned
+    def flush_hooks(self):
+        if self.hook_thread is not None:
+            self.hook_queue.join()
+
+
+    def task_done(self, result):
+        source_file = result['task']['source_file']
+        sxglobals.tasks_done += 1
+        sxglobals.task_times[source_file] = round(result['duration'], 2)
+        if result['error'] is not None:
+            sxglobals.errors.append(result['error'])
+        if len(result.get('kills', [])) > 0:
+            sxglobals.task_reports[source_file] = {'attempts': result['attempts'], 'kills': result['kills']}
+
+        elapsed = time.perf_counter() - sxglobals.then
+        remaining = sxglobals.tasks_total - sxglobals.tasks_done
+        sxglobals.eta = elapsed / sxglobals.tasks_done * remaining
+        status = 'failed' if result['error'] is not None else 'done'
+        logging.info(f'Node {sxglobals.ip_addr}: {sxglobals.tasks_done}/{sxglobals.tasks_total} {os.path.basename(source_file)} {status} in {result["duration"]: .2f} seconds, ETA {sxglobals.eta: .0f} seconds')
+
+        if len(self.completion_hooks) > 0:
+            if self.hook_thread is None:
+                self.hook_thread = threading.Thread(target=self.run_hooks, daemon=True)
+                self.hook_thread.start()
+            self.hook_queue.put(result)
+
+
+    # staging folders of a Blender that was killed or crashed before it could remove them
+    def delete_staging(self, task, pid):
+        if task.get('export_path') is None:
+            return
+        export_paths = [task['export_path']] + [os.path.join(task['export_path'], variant['name']) for variant in task.get('variants') or []]
+        for export_path in export_paths:
+            staging_path = os.path.join(export_path, f'.sx_staging_{pid}')
+            if os.path.isdir(staging_path):
+                scratch.delete(staging_path)
+
+
+    def get_script_args(self, sxtools_addon_path, export_path, sxtools_path, export_format, subdivision, palette, static_vertex_colors, collider_offset, objects=None, variants=None):
+        script_args = []
+        script_args.extend(["-sx", sxtools_addon_path])
+        script_args.extend(["-x", export_path])
+        script_args.extend(["-l", sxtools_path])
         if export_format is not None:
-            batch_args.extend(["-f", export_format])
+            script_args.extend(["-f", export_format])
         if subdivision is not None:
-            batch_args.extend(["-sd", subdivision])
+            script_args.extend(["-sd", subdivision])
         if palette is not None:
-            batch_args.extend(["-sp", palette])
+            script_args.extend(["-sp", palette])
         if static_vertex_colors:
-            batch_args.extend(["-st"])
+            script_args.extend(["-st"])
         if collider_offset:
-            batch_args.extend(["-co", collider_offset])
+            script_args.extend(["-co", collider_offset])
+        if objects is not None:
+            script_args.extend(["-ob"] + objects)
+        if variants is not None:
+            script_args.extend(["-va", json.dumps(variants)])
+        return script_args
+
+
+    # task dicts are expanded as keyword arguments
+    def get_batch_args(self, *,
+        blender_path, source_file, script_path, sxtools_addon_path, export_path, sxtools_path, export_format, subdivision,
+        palette, static_vertex_colors, collider_offset, debug, threads, cost=0, objects=None, variants=None, source_files=None):
+
+        # a session opens its source files from the work script
+        if source_files is not None:
+            batch_args = [blender_path, "--background", "--factory-startup", "--threads", threads, "-noaudio", "--python", script_path]
+        else:
+            batch_args = [blender_path, "--background", "--factory-startup", "--threads", threads, "-noaudio", source_file, "--python", script_path]
 
+        if debug:
+            batch_args.extend(["--debug"])
+        batch_args.extend(["--"])
+        batch_args.extend(self.get_script_args(sxtools_addon_path, export_path, sxtools_path, export_format, subdivision, palette, static_vertex_colors, collider_offset, objects, variants))
+        if source_files is not None:
+            batch_args.extend(["-i"] + source_files)
+
+        batch_args = isolation.get_command_prefix() + batch_args
         logging.debug(batch_args)
+        return batch_args
 
+
+    # runs a single task in the calling thread, batches use SXBATCHER_supervisor
+    def worker_process(self, **task):
+        source_file = task['source_file']
+        batch_args = self.get_batch_args(**task)
+
+        # Blender output is parsed as it arrives, only a bounded tail is kept in memory
+        log_parser = SXBATCHER_log_parser(source_file, task['debug'], objects=task.get('objects'))
         try:
-            p = subprocess.run(batch_args, check=True, text=True, encoding='utf-8', capture_output=True)
-            lines = p.stdout.splitlines()
-            counter = 0
-            for line in lines:
-                if debug:
-                    if 'clnors' not in line:
-                        logging.debug(line)
-                else:
-                    if 'Error' in line:
-                        counter = 10
-                        logging.error(line)
-                        return (source_file)
-                    if counter > 0:
-                        logging.error(line)
-                        counter -= 1
-        except subprocess.CalledProcessError as error:
+            with subprocess.Popen(batch_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace') as p:
+                for line in p.stdout:
+                    if log_parser.feed(line):
+                        p.kill()
+                        break
+                returncode = p.wait()
+        except OSError as error:
+            logging.critical(f'Blender process failed to start - {source_file}: {error}')
+            log_parser.close()
+            return (source_file)
+
+        error = log_parser.close()
+        if (returncode != 0) and (log_parser.fatal is None):
             logging.critical(f'Blender process crashed - {source_file}')
             return (source_file)
+        return error
+
+
+    # A task gets the share of free cores that its cost has of the remaining batch cost.
+    # Heavy files get several threads, light files one, and the tail of a batch
+    # spreads over the cores released by finished tasks.
+    def get_thread_count(self, cost, pending_cost, free_cores):
+        cost = max(1, cost)
+        pending_cost = max(cost, pending_cost)
+        threads = max(1, min(free_cores, round(free_cores * cost / pending_cost)))
+        if sxglobals.max_task_threads > 0:
+            threads = min(threads, sxglobals.max_task_threads)
+        return threads
+
+
+    # pooled Blenders are reused for as long as their launch settings match,
+    # their thread count is fixed at launch so each one runs single-threaded
+    def get_pool(self, task):
+        threads = task['threads'] if task['threads'] is not None else '1'
+        pool_key = (task['blender_path'], task['script_path'], task['sxtools_addon_path'], task['sxtools_path'], threads, task['debug'])
+        if (self.pool is not None) and (self.pool.key != pool_key):
+            self.pool.shutdown()
+            self.pool = None
+        if self.pool is None:
+            self.pool = SXBATCHER_blender_pool(pool_key)
+        return self.pool
+
+
+    def shutdown_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
 
 
     def worker_spawner(self, tasks, num_cores):
         logging.debug(f'Node {sxglobals.ip_addr} spawning workers')
 
-        mp = multiprocessing.get_context("spawn")
-        with mp.Pool(processes=num_cores, maxtasksperchild=1) as pool:
-            
-            for i, error in enumerate(pool.map(self.shim, tasks)):
-                progress = round((i + 1) / len(tasks) * 100)
-                # logging.info(f'Node {sxglobals.ip_addr}: Progress {progress}%')
-                if not sxglobals.headless:
-                    gui.progress_bar['value'] = progress
-                if error is not None:
-                    # logging.error(error)
-                    sxglobals.errors.append(error)
-            pool.close()
-            pool.join()
+        sxglobals.task_times = {}
+        sxglobals.task_reports = {}
+        sxglobals.task_outputs = {}
+        sxglobals.tasks_done = 0
+        sxglobals.tasks_total = len(tasks)
+        sxglobals.eta = None
+
+        tuning = autotuner.get_config(num_cores)
+        if tuning is not None:
+            logging.info(f'Node {sxglobals.ip_addr}: Using autotuned {tuning[0]} Blenders x {tuning[1]} threads')
+
+        # results arrive in completion order
+        if sxglobals.blender_pool and len(tasks) > 0:
+            num_workers = num_cores
+            if tuning is not None:
+                num_workers = tuning[0]
+                tasks = [dict(task, threads=str(tuning[1])) if task['threads'] is None else task for task in tasks]
+            for result in self.get_pool(tasks[0]).imap_unordered(tasks, num_workers):
+                self.task_done(result)
+        else:
+            adaptive = sxglobals.adaptive_cores and sxglobals.share_cpus and (len(sxglobals.remote_assignment) > 0)
+            SXBATCHER_supervisor(num_cores, adaptive=adaptive, tuning=tuning).run(tasks)
+        self.flush_hooks()
+
+        # tasks that another batcher was exporting are restored from the cache service, or run here if it failed
+        retry = artifact_cache.collect_deferred()
+        if len(retry) > 0:
+            sxglobals.tasks_total += len(retry)
+            SXBATCHER_supervisor(num_cores, tuning=tuning).run(retry)
+            self.flush_hooks()
+        if sxglobals.incremental_export:
+            fingerprints.save()
+        if sxglobals.use_cache:
+            artifact_cache.save()
 
         sxglobals.now = time.perf_counter()
         export_count = len(sxglobals.remote_assignment) if len(sxglobals.remote_assignment) > 0 else len(sxglobals.export_objs) 
@@ -876,26 +2653,1148 @@ class SXBATCHER_batch_local(object):
         # transfer files to master node
         logging.debug(f'Assignment: {sxglobals.remote_assignment}')
         if sxglobals.share_cpus and len(sxglobals.remote_assignment) > 0:
-            script_dir = os.path.dirname(os.path.realpath(__file__))
-            target_dir = str(os.path.join(script_dir, 'batch_results'))
+            job_id = sxglobals.remote_job
+            target_dir = scratch.get_dir(job_id, 'results')
             logging.debug(f'Submissions: {target_dir}')
             payload = []
             for_transfer = []
             for current_folder, subdirs, files in os.walk(target_dir):
+                # staging folders of crashed Blenders
+                subdirs[:] = [subdir for subdir in subdirs if not subdir.startswith('.sx_staging')]
                 logging.debug(f'Worker current folder: {current_folder}')
                 for file in files:
                     if (file.endswith('.fbx')) or (file.endswith('.glb')):
                         file_path = pathlib.Path(os.path.join(current_folder, file))
                         logging.debug(f'Payload file path: {file_path}')
-                        payload.append({'magic': 'ankdf89d', file: os.path.relpath(current_folder, target_dir)})
+                        payload.append({'magic': sxglobals.magic_result, file: os.path.relpath(current_folder, target_dir)})
                         logging.debug(f'Payload info: {os.path.relpath(current_folder, target_dir)}')
                         for_transfer.append(file_path)
 
-            if len(payload) > 0:
-                if init.transfer_files((sxglobals.master_node, sxglobals.file_transfer_port), (payload, for_transfer)):
+            # the last entry lists the failed source files by name, it is sent even without
+            # results so that the master always learns that this node has completed
+            payload.append({'magic': sxglobals.magic_result, 'errors': sorted(set(os.path.basename(error) for error in sxglobals.errors))})
+            scratch.hold(job_id)
+            try:
+                if init.transfer_files((sxglobals.master_node, sxglobals.file_transfer_port), (payload, for_transfer)) == 'ok':
                     logging.info(f'{len(for_transfer)} result files transferred to master node')
                 else:
                     logging.critical('Failed to transfer result files')
+            finally:
+                scratch.release(job_id)
+
+
+# ------------------------------------------------------------------------
+#    Blender Process Supervisor
+#    Launches and monitors headless Blenders from a single event loop,
+#    reports each task to batch_local.task_done as it finishes
+# ------------------------------------------------------------------------
+class SXBATCHER_supervisor(object):
+    def __init__(self, num_workers, adaptive=False, tuning=None):
+        self.num_workers = max(1, num_workers)
+        self.adaptive = adaptive
+        self.tuning = tuning
+        self.core_limit = self.num_workers
+        self.running = {}
+        self.free_cores = self.num_workers
+        self.cores_released = None
+        self.history = SXBATCHER_task_history()
+        self.slots = []
+
+
+    def run(self, tasks):
+        if len(tasks) > 0:
+            asyncio.run(self.supervise(tasks))
+
+
+    # Units of work start in the order they were prepared in, each reserving cores for its Blender threads.
+    # A unit is a single task, or several light tasks processed in one Blender session.
+    # With a memory budget, heavy and light units are interleaved and a unit is only started
+    # when the forecast memory of running units and the new unit fits the budget.
+    async def supervise(self, tasks):
+        self.free_cores = self.num_workers
+        self.core_limit = self.num_workers
+        self.cores_released = asyncio.Event()
+        units = self.group_tasks(tasks) if sxglobals.blender_sessions else [[task] for task in tasks]
+        memory_budget = self.history.get_memory_budget()
+        if memory_budget > 0:
+            units = self.interleave(units)
+            logging.debug(f'Node {sxglobals.ip_addr}: Memory budget {memory_budget} MB')
+
+        monitor = asyncio.create_task(self.monitor())
+        pending_cost = sum(self.get_cost(unit) for unit in units)
+        running = []
+        try:
+            for unit in units:
+                forecast = self.get_forecast(unit)
+                self.update_core_limit()
+                while (self.free_cores <= 0) or self.processes_full() or not self.memory_fits(forecast, memory_budget):
+                    self.cores_released.clear()
+                    try:
+                        await asyncio.wait_for(self.cores_released.wait(), 1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.update_core_limit()
+
+                cost = self.get_cost(unit)
+                if unit[0]['threads'] is not None:
+                    threads = int(unit[0]['threads'])
+                elif self.tuning is not None:
+                    threads = self.tuning[1]
+                else:
+                    threads = batch_local.get_thread_count(cost, pending_cost, self.free_cores)
+                threads = max(1, min(threads, self.free_cores))
+                pending_cost -= cost
+                self.free_cores -= threads
+                cpus = cpu_topology.allocate(threads) if cpu_topology.is_available() else None
+                slot = {'forecast': forecast, 'pid': None, 'peak_rss': 0, 'cpus': cpus}
+                self.slots.append(slot)
+                unit = [dict(task, threads=str(threads)) for task in unit]
+                logging.debug(f'Node {sxglobals.ip_addr}: Starting {", ".join(os.path.basename(task["source_file"]) for task in unit)} with {threads} threads, {self.free_cores} cores free, {forecast} MB forecast')
+                if len(unit) == 1:
+                    running.append(asyncio.create_task(self.run_task(unit[0], threads, slot)))
+                else:
+                    running.append(asyncio.create_task(self.run_session(unit, threads, slot)))
+            await asyncio.gather(*running)
+        finally:
+            monitor.cancel()
+            self.history.save()
+
+
+    # With adaptive sharing, the cores lent to the farm can change during a batch.
+    # Running Blenders finish, new ones start within the current limit.
+    def update_core_limit(self):
+        if self.adaptive:
+            core_limit = max(sxglobals.adaptive_active_cores, 1, min(self.num_workers, sxglobals.available_cores))
+            if core_limit != self.core_limit:
+                logging.debug(f'Node {sxglobals.ip_addr}: Core limit {self.core_limit} -> {core_limit}')
+                self.free_cores += core_limit - self.core_limit
+                self.core_limit = core_limit
+
+
+    def processes_full(self):
+        return (self.tuning is not None) and (len(self.slots) >= self.tuning[0])
+
+
+    def get_cost(self, unit):
+        return sum(max(1, int(task.get('cost', 0))) for task in unit)
+
+
+    # files in a session are processed one after another, so the largest one sets the peak
+    def get_forecast(self, unit):
+        return max(self.history.forecast(task) for task in unit)
+
+
+    # alternates between the heaviest and lightest remaining units
+    def interleave(self, units):
+        ordered = sorted(units, key=self.get_forecast, reverse=True)
+        interleaved = []
+        while len(ordered) > 0:
+            interleaved.append(ordered.pop(0))
+            if len(ordered) > 0:
+                interleaved.append(ordered.pop())
+        return interleaved
+
+
+    # Light tasks are grouped until Blender startup is at most session_overhead_ratio
+    # of the expected session time. Groups are kept small enough to leave work for every core,
+    # and tasks without a duration history run alone.
+    def group_tasks(self, tasks):
+        durations = [self.history.expected_duration(task) for task in tasks]
+        known = [duration for duration in durations if duration is not None]
+        if len(known) == 0:
+            return [[task] for task in tasks]
+
+        overhead = self.history.get_startup_overhead()
+        ratio = min(0.9, max(0.01, sxglobals.session_overhead_ratio))
+        target = min(overhead * (1.0 - ratio) / ratio, sum(known) / self.num_workers)
+
+        units = []
+        groups = {}
+        for task, duration in zip(tasks, durations):
+            if (duration is None) or (duration >= target):
+                units.append([task])
+                continue
+            # only tasks with identical settings can share a session
+            key = json.dumps({k: v for k, v in task.items() if k not in ('source_file', 'cost')}, sort_keys=True)
+            group, group_duration = groups.get(key, ([], 0.0))
+            group.append(task)
+            group_duration += duration
+            if group_duration >= target:
+                units.append(group)
+                group, group_duration = [], 0.0
+            groups[key] = (group, group_duration)
+
+        for group, group_duration in groups.values():
+            if len(group) > 0:
+                units.append(group)
+
+        if len(units) < len(tasks):
+            logging.info(f'Node {sxglobals.ip_addr}: {len(tasks)} files grouped into {len(units)} Blender sessions')
+        return units
+
+
+    # running units count with their current memory use or their forecast, whichever is higher
+    def memory_fits(self, forecast, memory_budget):
+        if (memory_budget == 0) or (len(self.slots) == 0):
+            return True
+        projected = forecast
+        for slot in self.slots:
+            rss = init.get_rss(slot['pid']) if slot['pid'] is not None else 0
+            projected += max(slot['forecast'], rss)
+        return projected <= memory_budget
+
+
+    async def monitor(self):
+        while True:
+            for job in list(self.running.values()):
+                job['slot']['peak_rss'] = max(job['slot']['peak_rss'], init.get_rss(job['pid'], peak=True))
+                if exit_handler.kill_now:
+                    job['process'].kill()
+                elif job['reason'] is None:
+                    job['reason'] = watchdog.check(job)
+                    if job['reason'] is not None:
+                        job['process'].kill()
+            await asyncio.sleep(1.0)
+
+
+    async def run_task(self, task, cores, slot):
+        then = time.perf_counter()
+        kills = []
+        try:
+            while True:
+                if exit_handler.kill_now:
+                    error, reason = task['source_file'], None
+                else:
+                    error, reason = await self.run_blender(task, slot)
+                if reason is None:
+                    break
+                kills.append(reason)
+                if not watchdog.retry(task, kills):
+                    break
+            if error is None:
+                # durations are kept without Blender startup to match files processed in sessions
+                self.history.record(task, peak=slot['peak_rss'], duration=max(0.0, time.perf_counter() - then - self.history.get_startup_overhead()))
+        finally:
+            self.slots.remove(slot)
+            cpu_topology.release(slot['cpus'])
+            self.free_cores += cores
+            self.cores_released.set()
+        batch_local.task_done({'task': task, 'error': error, 'duration': time.perf_counter() - then, 'attempts': len(kills) + 1, 'kills': kills})
+
+
+    # files left unprocessed by a crashed or killed session continue in a new session
+    async def run_session(self, group, cores, slot):
+        remaining = list(group)
+        kills = {}
+        try:
+            while (len(remaining) > 0) and not exit_handler.kill_now:
+                results = await self.run_blender_session(remaining, slot)
+                remaining = remaining[len(results):]
+                for result in results:
+                    task = result['task']
+                    task_kills = kills.setdefault(task['source_file'], [])
+                    if result['reason'] is not None:
+                        task_kills.append(result['reason'])
+                        if watchdog.retry(task, task_kills):
+                            remaining.insert(0, task)
+                            continue
+                    if result['error'] is None:
+                        self.history.record(task, duration=result['duration'])
+                    batch_local.task_done({'task': task, 'error': result['error'], 'duration': result['duration'], 'attempts': len(task_kills) + 1, 'kills': task_kills})
+        finally:
+            self.slots.remove(slot)
+            cpu_topology.release(slot['cpus'])
+            self.free_cores += cores
+            self.cores_released.set()
+
+        for task in remaining:
+            batch_local.task_done({'task': task, 'error': task['source_file'], 'duration': 0.0, 'attempts': 1, 'kills': []})
+
+
+    async def run_blender(self, task, slot):
+        source_file = task['source_file']
+        batch_args = batch_local.get_batch_args(**task)
+        log_parser = SXBATCHER_log_parser(source_file, task['debug'], objects=task.get('objects'))
+
+        try:
+            process = await asyncio.create_subprocess_exec(*batch_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, limit=2**20)
+        except OSError as error:
+            logging.critical(f'Blender process failed to start - {source_file}: {error}')
+            log_parser.close()
+            return (source_file), None
+
+        job = self.add_job(task, process, log_parser, slot)
+        try:
+            async for line in self.read_lines(process):
+                if log_parser.feed(line):
+                    process.kill()
+                    break
+            returncode = await process.wait()
+        finally:
+            self.remove_job(job)
+
+        error = log_parser.close()
+        if job['reason'] is not None:
+            logging.critical(f'Blender process killed - {source_file}: {job["reason"]}')
+            return (source_file), job['reason']
+        if (returncode != 0) and (log_parser.fatal is None):
+            logging.critical(f'Blender process crashed - {source_file}')
+            return (source_file), None
+        return error, None
+
+
+    # returns a result for each file the session finished or failed on, in order
+    async def run_blender_session(self, group, slot):
+        session_task = dict(group[0], cost=self.get_cost(group))
+        batch_args = batch_local.get_batch_args(**dict(session_task, source_files=[task['source_file'] for task in group]))
+        log_parser = SXBATCHER_log_parser(group[0]['source_file'], group[0]['debug'], objects=group[0].get('objects'))
+        results = []
+
+        then = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(*batch_args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, limit=2**20)
+        except OSError as error:
+            logging.critical(f'Blender process failed to start - {group[0]["source_file"]}: {error}')
+            log_parser.close()
+            return [{'task': task, 'error': task['source_file'], 'reason': None, 'duration': 0.0} for task in group]
+
+        job = self.add_job(session_task, process, log_parser, slot)
+        try:
+            async for line in self.read_lines(process):
+                if line.startswith('SX Session: '):
+                    reply = json.loads(line[len('SX Session: '):])
+                    now = time.perf_counter()
+                    if reply.get('status') == 'ready':
+                        self.history.record_startup(now - then)
+                    else:
+                        task = group[len(results)]
+                        error = log_parser.close()
+                        if reply.get('status') != 'done':
+                            error = task['source_file']
+                        results.append({'task': task, 'error': error, 'reason': None, 'duration': now - then})
+                        if len(results) < len(group):
+                            log_parser = SXBATCHER_log_parser(group[len(results)]['source_file'], group[0]['debug'], objects=group[0].get('objects'))
+                            job['log_parser'] = log_parser
+                    then = now
+                elif log_parser.feed(line):
+                    process.kill()
+                    break
+            returncode = await process.wait()
+        finally:
+            self.remove_job(job)
+
+        if len(results) < len(group):
+            # the session ended while processing a file
+            task = group[len(results)]
+            log_parser.close()
+            if job['reason'] is not None:
+                logging.critical(f'Blender process killed - {task["source_file"]}: {job["reason"]}')
+            elif (log_parser.fatal is None) and (returncode != 0):
+                logging.critical(f'Blender process crashed - {task["source_file"]}')
+            results.append({'task': task, 'error': task['source_file'], 'reason': job['reason'], 'duration': time.perf_counter() - then})
+        return results
+
+
+    def add_job(self, task, process, log_parser, slot):
+        job = watchdog.new_job(task, process.pid, log_parser)
+        job['process'] = process
+        job['slot'] = slot
+        slot['pid'] = process.pid
+        if slot['cpus'] is not None:
+            cpu_topology.pin(process.pid, slot['cpus'])
+        isolation.add_process(process.pid)
+        self.running[process.pid] = job
+        return job
+
+
+    def remove_job(self, job):
+        isolation.remove_process(job['pid'])
+        job['slot']['pid'] = None
+        del self.running[job['pid']]
+        batch_local.delete_staging(job['task'], job['pid'])
+
+
+    async def read_lines(self, process):
+        while True:
+            try:
+                line = await process.stdout.readline()
+            except ValueError:
+                # overlong line, the reader has already discarded it
+                continue
+            if not line:
+                return
+            yield line.decode('utf-8', errors='replace')
+
+
+# ------------------------------------------------------------------------
+#    CPU Topology and Affinity (Linux)
+#    Each Blender is pinned to a disjoint set of logical CPUs, kept
+#    within one NUMA node where possible, with SMT siblings of a
+#    physical core given to the same Blender
+# ------------------------------------------------------------------------
+class SXBATCHER_cpu_topology(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.used = set()
+        self.cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+        self.nodes = self.get_nodes()
+        self.cores = self.get_cores()
+
+
+    # NUMA node of each allowed CPU, a single node if the kernel does not report any
+    def get_nodes(self):
+        nodes = {}
+        for node_path in pathlib.Path('/sys/devices/system/node').glob('node[0-9]*'):
+            try:
+                for cpu in self.parse_cpu_list((node_path / 'cpulist').read_text()):
+                    if cpu in self.cpus:
+                        nodes[cpu] = int(node_path.name[4:])
+            except (OSError, ValueError):
+                continue
+        return {cpu: nodes.get(cpu, 0) for cpu in self.cpus}
+
+
+    # physical core of each allowed CPU as (package, core), SMT siblings share a key
+    def get_cores(self):
+        cores = {}
+        for cpu in self.cpus:
+            topology = pathlib.Path(f'/sys/devices/system/cpu/cpu{cpu}/topology')
+            try:
+                cores[cpu] = (int((topology / 'physical_package_id').read_text()), int((topology / 'core_id').read_text()))
+            except (OSError, ValueError):
+                cores[cpu] = (0, cpu)
+        return cores
+
+
+    # kernel list format, e.g. '0-3,8-11'
+    def parse_cpu_list(self, cpu_list):
+        cpus = []
+        for part in cpu_list.strip().split(','):
+            if '-' in part:
+                first, last = part.split('-')
+                cpus.extend(range(int(first), int(last) + 1))
+            elif part != '':
+                cpus.append(int(part))
+        return cpus
+
+
+    def is_supported(self):
+        return hasattr(os, 'sched_setaffinity') and (len(self.cpus) > 1)
+
+
+    def is_available(self):
+        return sxglobals.cpu_affinity and self.is_supported()
+
+
+    # Returns count CPUs, or None if not enough are free. The NUMA node with most free CPUs
+    # that fits the whole set is used, whole free physical cores are taken before partly used ones.
+    def allocate(self, count):
+        with self.lock:
+            free = [cpu for cpu in self.cpus if cpu not in self.used]
+            if (count < 1) or (len(free) < count):
+                return None
+
+            free_per_node = collections.Counter(self.nodes[cpu] for cpu in free)
+            fitting = [node for node, free_count in free_per_node.items() if free_count >= count]
+            if len(fitting) > 0:
+                node_order = [max(fitting, key=lambda node: free_per_node[node])]
+            else:
+                node_order = sorted(free_per_node, key=lambda node: free_per_node[node], reverse=True)
+
+            cpus = []
+            for node in node_order:
+                core_cpus = collections.defaultdict(list)
+                for cpu in self.cpus:
+                    if self.nodes[cpu] == node:
+                        core_cpus[self.cores[cpu]].append(cpu)
+                # fully free cores first, then cores with a sibling already in use
+                core_order = sorted(core_cpus.values(), key=lambda siblings: (any(cpu in self.used for cpu in siblings), siblings[0]))
+                for siblings in core_order:
+                    for cpu in siblings:
+                        if (len(cpus) < count) and (cpu not in self.used):
+                            cpus.append(cpu)
+                if len(cpus) == count:
+                    break
+
+            self.used.update(cpus)
+            return cpus
+
+
+    def release(self, cpus):
+        if cpus is not None:
+            with self.lock:
+                self.used.difference_update(cpus)
+
+
+    # threads started before pinning are moved as well
+    def pin(self, pid, cpus):
+        try:
+            tids = [int(tid) for tid in os.listdir(f'/proc/{pid}/task')]
+        except OSError:
+            tids = [pid]
+        for tid in tids:
+            try:
+                os.sched_setaffinity(tid, cpus)
+            except OSError:
+                pass
+
+
+# ------------------------------------------------------------------------
+#    Resource Isolation for Shared-CPU Nodes
+#    Blenders processing tasks from other nodes run with a lower
+#    CPU priority, idle I/O priority and optional cgroup v2 limits.
+#    Settings are reapplied to running Blenders when they change.
+# ------------------------------------------------------------------------
+class SXBATCHER_isolation(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pids = set()
+        self.cgroup = None
+        self.cgroup_failed = False
+        self.conf_mtime = None
+
+
+    # only batches received from other nodes are isolated
+    def is_active(self):
+        return sxglobals.share_cpus and (len(sxglobals.remote_assignment) > 0)
+
+
+    def add_process(self, pid):
+        if not self.is_active():
+            return
+        with self.lock:
+            self.pids.add(pid)
+        self.apply(pid)
+
+
+    def remove_process(self, pid):
+        with self.lock:
+            self.pids.discard(pid)
+
+
+    def get_pids(self):
+        with self.lock:
+            return list(self.pids)
+
+
+    def apply(self, pid):
+        self.set_priority(pid)
+        cgroup = self.get_cgroup()
+        if cgroup is not None:
+            try:
+                (cgroup / 'cgroup.procs').write_text(str(pid))
+            except OSError as error:
+                logging.debug(f'Node {sxglobals.ip_addr}: Could not move {pid} to {cgroup}: {error}')
+
+
+    # Blenders of isolated batches are started through ionice, so that
+    # spawning does not wait for a separate ionice call
+    def get_command_prefix(self):
+        if not self.is_active() or (shutil.which('ionice') is None):
+            return []
+        return ['ionice'] + self.get_io_class()
+
+
+    def get_io_class(self):
+        return ['-c', '3'] if sxglobals.node_io_idle else ['-c', '2', '-n', '7']
+
+
+    # nice is per thread on Linux, threads started before this call are updated as well
+    def set_priority(self, pid):
+        if hasattr(os, 'setpriority'):
+            try:
+                tids = [int(tid) for tid in os.listdir(f'/proc/{pid}/task')]
+            except OSError:
+                tids = [pid]
+            for tid in tids:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, max(0, min(19, sxglobals.node_nice)))
+                except OSError:
+                    pass
+
+
+    # running Blenders follow a changed IO class, new ones get it from get_command_prefix
+    def set_io_class(self, pid):
+        if shutil.which('ionice') is not None:
+            subprocess.run(['ionice'] + self.get_io_class() + ['-p', str(pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+    # A child group next to the batcher's own cgroup, used when it is writable.
+    # Without limits no cgroup is created.
+    def get_cgroup(self):
+        if self.cgroup_failed or ((self.get_cpu_limit() <= 0) and (sxglobals.node_memory_limit <= 0) and (self.cgroup is None)):
+            return None
+        if self.cgroup is None:
+            try:
+                with open('/proc/self/cgroup', 'r') as proc_cgroup:
+                    own_path = [line.strip().split('::', 1)[1] for line in proc_cgroup if line.startswith('0::')][0]
+                own_cgroup = pathlib.Path('/sys/fs/cgroup') / own_path.lstrip('/')
+                parent = own_cgroup.parent if own_path != '/' else own_cgroup
+                cgroup = parent / 'sx_batcher_node'
+                cgroup.mkdir(exist_ok=True)
+                self.cgroup = cgroup
+                self.write_limits()
+                logging.info(f'Node {sxglobals.ip_addr}: Using cgroup {cgroup}')
+            except (OSError, IndexError) as error:
+                logging.warning(f'Node {sxglobals.ip_addr}: cgroup limits not available: {error}')
+                self.cgroup = None
+                self.cgroup_failed = True
+        return self.cgroup
+
+
+    # adaptive sharing also throttles running Blenders to the cores currently lent
+    def get_cpu_limit(self):
+        cpu_limit = sxglobals.node_cpu_limit
+        if sxglobals.adaptive_cores:
+            adaptive_limit = max(sxglobals.adaptive_active_cores, sxglobals.available_cores, 1)
+            cpu_limit = min(cpu_limit, adaptive_limit) if cpu_limit > 0 else adaptive_limit
+        return cpu_limit
+
+
+    def write_limits(self):
+        if self.cgroup is None:
+            return
+        cpu_limit = self.get_cpu_limit()
+        cpu_max = f'{int(cpu_limit * 100000)} 100000' if cpu_limit > 0 else 'max 100000'
+        memory_max = str(sxglobals.node_memory_limit * 1024 * 1024) if sxglobals.node_memory_limit > 0 else 'max'
+        for controller, value in (('cpu.max', cpu_max), ('memory.max', memory_max)):
+            try:
+                (self.cgroup / controller).write_text(value)
+            except OSError as error:
+                logging.warning(f'Node {sxglobals.ip_addr}: Could not set {controller}: {error}')
+
+
+    # Called when settings change, running Blenders pick up the new values.
+    # cgroup creation is retried only for changed settings, not for adaptive core limits.
+    def update(self, settings_changed=True):
+        if settings_changed:
+            self.cgroup_failed = False
+        self.write_limits()
+        with self.lock:
+            pids = list(self.pids)
+        for pid in pids:
+            self.apply(pid)
+            if settings_changed:
+                self.set_io_class(pid)
+        logging.debug(f'Node {sxglobals.ip_addr}: Isolation settings applied to {len(pids)} Blenders')
+
+
+    # headless nodes follow edits of sx_conf.json
+    def check_conf(self):
+        conf_path = os.path.realpath(__file__).replace(os.path.basename(__file__), 'sx_conf.json')
+        try:
+            mtime = os.path.getmtime(conf_path)
+        except OSError:
+            return
+        if self.conf_mtime is None:
+            self.conf_mtime = mtime
+        elif mtime != self.conf_mtime:
+            self.conf_mtime = mtime
+            conf = init.load_conf()
+            sxglobals.node_nice = int(conf.get('node_nice', sxglobals.node_nice))
+            sxglobals.node_io_idle = bool(int(conf.get('node_io_idle', sxglobals.node_io_idle)))
+            sxglobals.node_cpu_limit = float(conf.get('node_cpu_limit', sxglobals.node_cpu_limit))
+            sxglobals.node_memory_limit = int(conf.get('node_memory_limit', sxglobals.node_memory_limit))
+            self.update()
+
+
+# ------------------------------------------------------------------------
+#    Concurrency Autotuner
+#    Keeps the best measured number of Blender processes and threads
+#    per Blender for each hardware fingerprint
+# ------------------------------------------------------------------------
+class SXBATCHER_autotuner(object):
+    def __init__(self):
+        self.path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sx_autotune.json')
+        self.fingerprint = None
+
+
+    # CPU model, core count, memory and Blender build, nodes sharing the script folder keep separate results
+    def get_fingerprint(self):
+        if self.fingerprint is None:
+            cpu_model = platform.processor()
+            try:
+                with open('/proc/cpuinfo', 'r') as cpuinfo:
+                    for line in cpuinfo:
+                        if line.startswith('model name'):
+                            cpu_model = line.split(':', 1)[1].strip()
+                            break
+            except OSError:
+                pass
+            try:
+                with open('/proc/meminfo', 'r') as meminfo:
+                    memory = int(meminfo.readline().split()[1]) // (1024 * 1024)
+            except (OSError, ValueError, IndexError):
+                memory = 0
+            blender_size = os.path.getsize(sxglobals.blender_path) if os.path.isfile(sxglobals.blender_path) else 0
+            identity = f'{platform.system()}|{platform.machine()}|{cpu_model}|{multiprocessing.cpu_count()}|{memory}|{blender_size}'
+            self.fingerprint = f'{zlib.crc32(identity.encode("utf-8")):08x}'
+        return self.fingerprint
+
+
+    def store(self, processes, threads, results):
+        tunings = init.load_json(self.path) if os.path.isfile(self.path) else {}
+        tunings[self.get_fingerprint()] = {
+            'host': socket.gethostname(),
+            'cores': multiprocessing.cpu_count(),
+            'processes': processes,
+            'threads': threads,
+            'results': results,
+            'time': int(time.time())
+        }
+        init.save_json(self.path, tunings)
+
+
+    # (processes, threads) scaled to num_cores, None if this hardware has not been tuned
+    def get_config(self, num_cores):
+        if not sxglobals.use_autotune or not os.path.isfile(self.path):
+            return None
+        tuning = init.load_json(self.path).get(self.get_fingerprint())
+        if tuning is None:
+            return None
+        threads = max(1, min(int(tuning['threads']), num_cores))
+        return max(1, num_cores // threads), threads
+
+
+# ------------------------------------------------------------------------
+#    Task History
+#    Peak memory and duration of each asset are recorded after
+#    successful runs. Memory forecasts admit new Blender processes
+#    within a memory budget, durations decide session grouping.
+# ------------------------------------------------------------------------
+class SXBATCHER_task_history(object):
+    def __init__(self):
+        self.path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sx_history.json')
+        history = init.load_json(self.path) if os.path.isfile(self.path) else {}
+        self.records = history.get('tasks', {})
+        self.startup_overhead = float(history.get('startup_overhead', 5.0))
+        self.changed = False
+
+
+    def get_memory_budget(self):
+        if sxglobals.memory_budget > 0:
+            return sxglobals.memory_budget
+        return int(init.get_available_memory() * 0.9)
+
+
+    # subdivision overrides and object shards change memory use and duration, so they are part of the key
+    def get_key(self, task):
+        key = f'{os.path.basename(task["source_file"])}:{task["subdivision"]}'
+        if task.get('objects') is not None:
+            key += f':{zlib.crc32("|".join(task["objects"]).encode("utf-8")):08x}'
+        if task.get('variants') is not None:
+            key += f':{len(task["variants"])}v'
+        return key
+
+
+    # in MB, unknown assets are estimated from the median memory per cost of known ones
+    def forecast(self, task):
+        record = self.records.get(self.get_key(task), {})
+        if record.get('peak', 0) > 0:
+            return int(record['peak'])
+
+        ratios = sorted(float(record['peak']) / max(1, int(record['cost'])) for record in self.records.values() if record.get('peak', 0) > 0)
+        if len(ratios) > 0:
+            return max(sxglobals.default_task_memory // 4, int(ratios[len(ratios) // 2] * max(1, int(task.get('cost', 0)))))
+        return sxglobals.default_task_memory
+
+
+    # in seconds, estimated from the median time per cost of known assets, None without history
+    def expected_duration(self, task):
+        record = self.records.get(self.get_key(task), {})
+        if 'duration' in record:
+            return float(record['duration'])
+
+        ratios = sorted(float(record['duration']) / max(1, int(record['cost'])) for record in self.records.values() if 'duration' in record)
+        if len(ratios) > 0:
+            return ratios[len(ratios) // 2] * max(1, int(task.get('cost', 0)))
+        return None
+
+
+    def get_startup_overhead(self):
+        return self.startup_overhead
+
+
+    def record(self, task, peak=0, duration=None):
+        record = self.records.setdefault(self.get_key(task), {})
+        record['cost'] = int(task.get('cost', 0))
+        if peak > 0:
+            record['peak'] = int(peak)
+        if duration is not None:
+            record['duration'] = round(duration, 2)
+        self.changed = True
+
+
+    # smoothed time from Blender launch to the work script being ready
+    def record_startup(self, seconds):
+        self.startup_overhead = round(0.8 * self.startup_overhead + 0.2 * seconds, 2)
+        self.changed = True
+
+
+    def save(self):
+        if self.changed:
+            init.save_json(self.path, {'startup_overhead': self.startup_overhead, 'tasks': self.records})
+            self.changed = False
+
+
+# ------------------------------------------------------------------------
+#    Watchdog
+#    Detects Blender processes that exceed their time budget,
+#    stop using CPU or stop producing output
+# ------------------------------------------------------------------------
+class SXBATCHER_watchdog(object):
+    def __init__(self):
+        return None
+
+
+    # the wall-clock budget scales with catalogue cost, None if disabled
+    def get_budget(self, task):
+        if sxglobals.task_timeout == 0:
+            return None
+        return sxglobals.task_timeout + float(task.get('cost', 0)) / 1000.0 * sxglobals.task_timeout_per_kcost
+
+
+    def new_job(self, task, pid, log_parser):
+        now = time.monotonic()
+        return {
+            'task': task,
+            'pid': pid,
+            'log_parser': log_parser,
+            'started': now,
+            'budget': self.get_budget(task),
+            'cpu_time': None,
+            'cpu_changed': now,
+            'reason': None
+        }
+
+
+    # returns the reason to kill the job, or None
+    def check(self, job):
+        now = time.monotonic()
+        if (job['budget'] is not None) and (now - job['started'] > job['budget']):
+            return f'exceeded time budget of {job["budget"]:.0f} seconds'
+
+        if (sxglobals.silence_timeout > 0) and (now - job['log_parser'].last_output > sxglobals.silence_timeout):
+            return f'no output for {sxglobals.silence_timeout} seconds'
+
+        if sxglobals.stall_timeout > 0:
+            cpu_time = init.get_cpu_time(job['pid'])
+            if cpu_time is not None:
+                if cpu_time != job['cpu_time']:
+                    job['cpu_time'] = cpu_time
+                    job['cpu_changed'] = now
+                elif now - job['cpu_changed'] > sxglobals.stall_timeout:
+                    return f'no CPU progress for {sxglobals.stall_timeout} seconds'
+        return None
+
+
+    def retry(self, task, kills):
+        if len(kills) > sxglobals.task_retries:
+            return False
+        logging.warning(f'Node {sxglobals.ip_addr}: Retrying {task["source_file"]} ({len(kills)}/{sxglobals.task_retries}), {kills[-1]}')
+        return True
+
+
+# ------------------------------------------------------------------------
+#    Blender Output Parsing
+#    Scans Blender output line by line, keeps a bounded tail in memory
+#    and writes the full output to a compressed per-task log file
+# ------------------------------------------------------------------------
+class SXBATCHER_log_parser(object):
+    # shards of a file are told apart by their objects
+    def __init__(self, source_file, debug, keep_log=True, objects=None):
+        self.source_file = source_file
+        self.debug = debug
+        self.tail = collections.deque(maxlen=max(1, sxglobals.log_tail_lines))
+        self.error = None
+        self.fatal = None
+        self.counter = 0
+        self.last_output = time.monotonic()
+        self.fatal_patterns = [re.compile(pattern) for pattern in sxglobals.fatal_patterns]
+        self.log_file = None
+        self.log_key = source_file if objects is None else source_file + '|' + '|'.join(objects)
+        self.outputs = []
+
+        if keep_log and sxglobals.task_logs:
+            log_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'batch_logs')
+            os.makedirs(log_dir, exist_ok=True)
+            log_name = f'{pathlib.Path(source_file).stem}_{zlib.crc32(self.log_key.encode("utf-8")):08x}.log.gz'
+            try:
+                self.log_file = gzip.open(os.path.join(log_dir, log_name), 'wt', encoding='utf-8')
+            except OSError as error:
+                logging.warning(f'Node {sxglobals.ip_addr}: Could not open log file {log_name}: {error}')
+
+
+    # returns True if the line matches a fatal pattern and the process should be killed
+    def feed(self, line):
+        line = line.rstrip('\n')
+        self.last_output = time.monotonic()
+        self.tail.append(line)
+        if self.log_file is not None:
+            self.log_file.write(line + '\n')
+        if line.startswith('SX Export: '):
+            self.outputs.append(line[len('SX Export: '):])
+            init.count_output(True)
+        elif line.startswith('SX Unchanged: '):
+            self.outputs.append(line[len('SX Unchanged: '):])
+            init.count_output(False)
+
+        if self.debug:
+            if 'clnors' not in line:
+                logging.debug(line)
+        elif (self.error is None) and ('Error' in line):
+            # log the first error and the lines following it
+            self.error = line
+            self.counter = 10
+            logging.error(line)
+        elif self.counter > 0:
+            logging.error(line)
+            self.counter -= 1
+
+        for pattern in self.fatal_patterns:
+            if pattern.search(line):
+                self.fatal = line
+                logging.critical(f'Fatal Blender output, aborting {self.source_file}: {line}')
+                return True
+        return False
+
+
+    # returns the source file if the output contained errors
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+        # exported files listed by the work script
+        sxglobals.task_outputs[self.log_key] = self.outputs
+        if (self.error is not None) or (self.fatal is not None):
+            return self.source_file
+        return None
+
+
+# ------------------------------------------------------------------------
+#    Persistent Blender Pool
+#    Headless Blenders with the work script already loaded,
+#    each receives one source file at a time over stdin
+# ------------------------------------------------------------------------
+class SXBATCHER_blender_worker(object):
+    def __init__(self, key):
+        self.key = key
+        self.process = None
+        self.job_count = 0
+        self.job = None
+        self.cpus = None
+
+
+    def is_alive(self):
+        return (self.process is not None) and (self.process.poll() is None)
+
+
+    def start(self):
+        blender_path, script_path, sxtools_addon_path, sxtools_path, threads, debug = self.key
+        batch_args = isolation.get_command_prefix() + [blender_path, "--background", "--factory-startup", "--threads", threads, "-noaudio", "--python", script_path]
+        if debug:
+            batch_args.extend(["--debug"])
+        batch_args.extend(["--", "-pool", "-sx", sxtools_addon_path, "-l", sxtools_path])
+        logging.debug(batch_args)
+
+        self.process = subprocess.Popen(batch_args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace', bufsize=1)
+        self.job_count = 0
+        cpu_topology.release(self.cpus)
+        self.cpus = cpu_topology.allocate(int(threads)) if cpu_topology.is_available() else None
+        if self.cpus is not None:
+            cpu_topology.pin(self.process.pid, self.cpus)
+        isolation.add_process(self.process.pid)
+        log_parser = SXBATCHER_log_parser(script_path, debug, keep_log=False)
+        self.job = watchdog.new_job({'source_file': script_path}, self.process.pid, log_parser)
+        reply = self.read_reply(log_parser)
+        log_parser.close()
+        self.job = None
+        if reply is None:
+            for line in list(log_parser.tail)[-10:]:
+                logging.error(line)
+            logging.critical(f'Node {sxglobals.ip_addr}: Pooled Blender failed to start')
+            self.stop()
+            return False
+        logging.debug(f'Node {sxglobals.ip_addr}: Pooled Blender {self.process.pid} ready')
+        return True
+
+
+    # parses output until the work script reports back, reply is None if Blender exited or hit a fatal pattern
+    def read_reply(self, log_parser):
+        while line := self.process.stdout.readline():
+            if line.startswith('SX Pool: '):
+                return line[len('SX Pool: '):].rstrip('\n')
+            if log_parser.feed(line):
+                self.process.kill()
+                return None
+        return None
+
+
+    # returns the error and the watchdog kill reason
+    def run_job(self, task):
+        source_file = task['source_file']
+        if not self.is_alive() and not self.start():
+            return source_file, None
+
+        job = {
+            'source_file': source_file,
+            'args': batch_local.get_script_args(
+                task['sxtools_addon_path'], task['export_path'], task['sxtools_path'], task['export_format'],
+                task['subdivision'], task['palette'], task['static_vertex_colors'], task['collider_offset'], task.get('objects'), task.get('variants'))
+        }
+
+        log_parser = SXBATCHER_log_parser(source_file, task['debug'], objects=task.get('objects'))
+        self.job = watchdog.new_job(task, self.process.pid, log_parser)
+        try:
+            self.process.stdin.write(json.dumps(job) + '\n')
+            self.process.stdin.flush()
+            reply = self.read_reply(log_parser)
+        except OSError:
+            reply = None
+        error = log_parser.close()
+        reason = self.job['reason']
+        self.job = None
+
+        if reply is None:
+            if reason is not None:
+                logging.critical(f'Blender process killed - {source_file}: {reason}')
+            elif log_parser.fatal is None:
+                logging.critical(f'Blender process crashed - {source_file}')
+            pid = self.process.pid
+            self.stop()
+            batch_local.delete_staging(task, pid)
+            return source_file, reason
+
+        self.job_count += 1
+        if json.loads(reply).get('status') != 'done':
+            error = source_file
+        self.check_recycle()
+        return error, None
+
+
+    # called from the pool monitor thread
+    def check_watchdog(self):
+        job = self.job
+        if (job is not None) and (job['reason'] is None):
+            job['reason'] = watchdog.check(job)
+            process = self.process
+            if (job['reason'] is not None) and (process is not None):
+                process.kill()
+
+
+    # called from the pool monitor thread on exit
+    def kill(self):
+        process = self.process
+        if process is not None:
+            process.kill()
+
+
+    def check_recycle(self):
+        reason = None
+        if (sxglobals.pool_recycle_count > 0) and (self.job_count >= sxglobals.pool_recycle_count):
+            reason = f'{self.job_count} files processed'
+        elif sxglobals.pool_memory_limit > 0:
+            rss = init.get_rss(self.process.pid)
+            if rss > sxglobals.pool_memory_limit:
+                reason = f'{rss} MB resident'
+
+        if reason is not None:
+            logging.debug(f'Node {sxglobals.ip_addr}: Recycling pooled Blender {self.process.pid}, {reason}')
+            self.stop()
+
+
+    def stop(self):
+        if self.process is None:
+            return
+        isolation.remove_process(self.process.pid)
+        try:
+            # closing stdin ends the job loop in the work script
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+        cpu_topology.release(self.cpus)
+        self.cpus = None
+
+
+class SXBATCHER_blender_pool(object):
+    def __init__(self, key):
+        self.key = key
+        self.workers = []
+
+
+    # Yields results in completion order, like multiprocessing.Pool.imap_unordered.
+    # On exit the workers are killed and the tasks that have not run are yielded as failed.
+    def imap_unordered(self, tasks, num_workers):
+        while len(self.workers) < num_workers:
+            self.workers.append(SXBATCHER_blender_worker(self.key))
+
+        job_queue = queue.Queue()
+        result_queue = queue.Queue()
+        for task in tasks:
+            job_queue.put(task)
+
+        def serve(worker):
+            while not exit_handler.kill_now:
+                try:
+                    task = job_queue.get_nowait()
+                except queue.Empty:
+                    return
+                then = time.perf_counter()
+                kills = []
+                while True:
+                    error, reason = worker.run_job(task)
+                    if reason is None:
+                        break
+                    kills.append(reason)
+                    if not watchdog.retry(task, kills):
+                        break
+                result_queue.put({'task': task, 'error': error, 'duration': time.perf_counter() - then, 'attempts': len(kills) + 1, 'kills': kills})
+
+        def monitor(workers, done):
+            while not done.wait(1.0):
+                for worker in workers:
+                    if exit_handler.kill_now:
+                        worker.kill()
+                    else:
+                        worker.check_watchdog()
+
+        done = threading.Event()
+        threads = [threading.Thread(target=serve, args=(worker, )) for worker in self.workers[:num_workers]]
+        for t in threads:
+            t.start()
+        monitor_thread = threading.Thread(target=monitor, args=(self.workers[:num_workers], done))
+        monitor_thread.start()
+        try:
+            received = 0
+            while received < len(tasks):
+                try:
+                    result = result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    # interrupted workers stop serving and leave their tasks queued
+                    if exit_handler.kill_now and result_queue.empty() and not any(t.is_alive() for t in threads):
+                        break
+                    continue
+                received += 1
+                yield result
+            while not job_queue.empty():
+                task = job_queue.get_nowait()
+                yield {'task': task, 'error': task['source_file'], 'duration': 0.0, 'attempts': 1, 'kills': []}
+        finally:
+            done.set()
+            for t in threads:
+                t.join()
+            monitor_thread.join()
+            if exit_handler.kill_now:
+                self.shutdown()
+
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
 
 
 # ------------------------------------------------------------------------
@@ -934,6 +3833,116 @@ class SXBATCHER_node_broadcast_thread(threading.Thread):
                 time.sleep(1.0)
 
 
+# ------------------------------------------------------------------------
+#    Adaptive Core Sharing
+#    Samples local load and user input idle time, and adjusts the
+#    number of cores lent to the farm. Cores are released at once
+#    when the user is active, and raised one at a time when idle.
+# ------------------------------------------------------------------------
+class SXBATCHER_load_monitor_thread(threading.Thread):
+    def __init__(self, interval=5.0):
+        super().__init__()
+        self.interval = interval
+        self.cpu_stat = None
+        self.cpu_times = {}
+
+
+    def run(self):
+        while True:
+            if sxglobals.share_cpus and sxglobals.adaptive_cores:
+                cores = self.get_spare_cores()
+                if cores != sxglobals.available_cores:
+                    logging.info(f'Node {sxglobals.ip_addr}: Sharing {cores} of {sxglobals.shared_cores} cores')
+                    sxglobals.available_cores = cores
+                    isolation.update(settings_changed=False)
+            time.sleep(self.interval)
+
+
+    def get_spare_cores(self):
+        cpu_count = multiprocessing.cpu_count()
+        shared_cores = sxglobals.shared_cores if sxglobals.shared_cores > 0 else cpu_count
+        idle_time = self.get_input_idle_time()
+        if (idle_time is not None) and (idle_time < sxglobals.adaptive_idle_time):
+            return min(shared_cores, sxglobals.adaptive_active_cores)
+
+        # load caused by everything except the Blenders of node tasks
+        busy = self.get_busy_cores()
+        if busy is None:
+            busy = os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0.0
+        foreign = max(0.0, busy - self.get_own_cores())
+        spare = max(0, min(shared_cores, int(cpu_count - foreign - sxglobals.adaptive_headroom)))
+        return min(spare, sxglobals.available_cores + 1)
+
+
+    # sum of per-core utilisation since the previous sample from /proc/stat, None if not available
+    def get_busy_cores(self):
+        try:
+            with open('/proc/stat', 'r') as stat:
+                cpu_stat = {}
+                for line in stat:
+                    if line.startswith('cpu') and line[3].isdigit():
+                        fields = [int(value) for value in line.split()[1:]]
+                        # idle and iowait
+                        cpu_stat[line.split()[0]] = (sum(fields) - fields[3] - fields[4], sum(fields))
+        except (OSError, ValueError, IndexError):
+            return None
+
+        busy = None
+        if self.cpu_stat is not None:
+            busy = 0.0
+            for cpu, (used, total) in cpu_stat.items():
+                last_used, last_total = self.cpu_stat.get(cpu, (used, total))
+                if total > last_total:
+                    busy += (used - last_used) / (total - last_total)
+        self.cpu_stat = cpu_stat
+        return busy
+
+
+    # cores used by Blenders of node tasks since the previous sample
+    def get_own_cores(self):
+        now = time.monotonic()
+        cores = 0.0
+        cpu_times = {}
+        for pid in isolation.get_pids():
+            cpu_time = init.get_cpu_time(pid)
+            if cpu_time is None:
+                continue
+            cpu_times[pid] = (now, cpu_time)
+            if pid in self.cpu_times:
+                then, last_cpu_time = self.cpu_times[pid]
+                if now > then:
+                    cores += (cpu_time - last_cpu_time) / (now - then)
+        self.cpu_times = cpu_times
+        return cores
+
+
+    # seconds since the last keyboard or mouse input, None if not available
+    def get_input_idle_time(self):
+        system = platform.system()
+        try:
+            if system == 'Windows':
+                import ctypes
+
+                class LASTINPUTINFO(ctypes.Structure):
+                    _fields_ = [('cbSize', ctypes.c_uint), ('dwTime', ctypes.c_uint)]
+
+                last_input = LASTINPUTINFO()
+                last_input.cbSize = ctypes.sizeof(last_input)
+                if ctypes.windll.user32.GetLastInputInfo(ctypes.byref(last_input)):
+                    return (ctypes.windll.kernel32.GetTickCount() - last_input.dwTime) / 1000.0
+            elif system == 'Darwin':
+                output = subprocess.run(['ioreg', '-c', 'IOHIDSystem'], capture_output=True, text=True, timeout=5).stdout
+                match = re.search(r'"HIDIdleTime" = (\d+)', output)
+                if match:
+                    return int(match.group(1)) / 1e9
+            elif shutil.which('xprintidle') is not None:
+                output = subprocess.run(['xprintidle'], capture_output=True, text=True, timeout=5).stdout
+                return int(output.strip()) / 1000.0
+        except (OSError, ValueError, AttributeError, subprocess.TimeoutExpired):
+            pass
+        return None
+
+
 # ------------------------------------------------------------------------
 #    Network Node Discovery
 #    Runs on host, receives multicast broadcasts from available nodes
@@ -1007,11 +4016,23 @@ class SXBATCHER_node_file_listener_thread(threading.Thread):
                         time.sleep(0.01)
                     task_data = json.loads(b.decode('utf-8'))
                     logging.debug(f'Node {sxglobals.ip_addr}: Task data received')
-                    conn.close()
 
                     file_meta = task_data.pop(0)
                     transfer_data = [(pathlib.Path(file_and_size[0]).name, int(file_and_size[1])) for file_and_size in file_meta]
 
+                    # node tasks are only accepted with room for sources and results,
+                    # a rejected sender keeps the files and sends no file connection
+                    status = 'ok'
+                    if (len(task_data) > 0) and (task_data[0]['magic'] == sxglobals.magic_task) and not scratch.has_space(sum(size for file, size in transfer_data)):
+                        logging.error(f'Node {sxglobals.ip_addr}: Rejecting {len(transfer_data)} files from Node {current_client[0]}, not enough disk space')
+                        status = 'rejected'
+                    conn.sendall((json.dumps({'status': status}) + '\n').encode('utf-8'))
+                    conn.close()
+                    if status == 'rejected':
+                        continue
+                    if (len(task_data) > 0) and (task_data[0]['magic'] == sxglobals.magic_task) and (sxglobals.remote_job is None):
+                        sxglobals.remote_job = scratch.new_job('node')
+
                     # 2 - receive files
                     new_client = 'x'
                     conn = None
@@ -1025,9 +4046,7 @@ class SXBATCHER_node_file_listener_thread(threading.Thread):
 
                     for i, (file, size) in enumerate(transfer_data):
                         if task_data[i]['magic'] == sxglobals.magic_task:
-                            # target_dir = os.path.realpath('batch_submissions')
-                            script_dir = os.path.dirname(os.path.realpath(__file__))
-                            target_dir = os.path.join(script_dir, 'batch_submissions')
+                            target_dir = scratch.get_dir(sxglobals.remote_job, 'submissions')
                             logging.debug(f'Target dir (network batch): {target_dir}')
                         else:
                             target_dir = os.path.join(sxglobals.export_path, task_data[i][file])
@@ -1035,23 +4054,23 @@ class SXBATCHER_node_file_listener_thread(threading.Thread):
                             logging.debug(f'Received File Target Dir: {target_dir}')
                             os.makedirs(target_dir, exist_ok=True)
 
-                        with open(os.path.join(target_dir, file), 'wb') as f:
+                        # results identical to the existing export are not rewritten
+                        file_path = os.path.join(target_dir, file)
+                        temp_path = file_path + '.sx_tmp' if task_data[i]['magic'] != sxglobals.magic_task else file_path
+                        with open(temp_path, 'wb') as f:
                             left = size
                             while left:
                                 quot, remain = divmod(left, self.bufsize)
                                 left -= f.write(conn.recv(self.bufsize if quot else remain))
                             logging.debug(f'Wrote {file} ({f.tell()}/{size})')
+                        if temp_path != file_path:
+                            init.replace_if_changed(temp_path, file_path)
                     conn.close()
                     logging.info(f'Node {sxglobals.ip_addr}: {len(transfer_data)} files received from Node {addr[0]}')
 
                     # check which nodes have finished their tasks based on connection address
-                    if (addr[0] in sxglobals.tasked_nodes) and (task_data[0]['magic'] != sxglobals.magic_task):
-                        sxglobals.tasked_nodes.remove(addr[0])
-                        logging.info(f'Node {addr[0]} completed tasks')
-                        if len(sxglobals.tasked_nodes) == 0:
-                            sxglobals.now = time.perf_counter()
-                            logging.info(f'All nodes finished')
-                            manager.finish_task()
+                    if task_data[0]['magic'] != sxglobals.magic_task:
+                        manager.node_completed(addr[0], task_data[-1].get('errors', []))
 
                     if sxglobals.share_cpus and (task_data is not None) and (task_data[0]['magic'] == sxglobals.magic_task):
                         sxglobals.master_node = task_data[0]['master']
@@ -1069,6 +4088,32 @@ class SXBATCHER_node_file_listener_thread(threading.Thread):
                 time.sleep(1.0)
 
 
+# ------------------------------------------------------------------------
+#    Cache Service Listener
+#    Each connection is handled in its own thread, a request for a
+#    key that is being exported may wait for the upload
+# ------------------------------------------------------------------------
+class SXBATCHER_cache_server_thread(threading.Thread):
+    def __init__(self, port):
+        super().__init__()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', port))
+        self.sock.listen()
+
+
+    def run(self):
+        artifact_cache.load()
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+                handler = threading.Thread(target=cache_service.handle, args=(conn, addr), daemon=True)
+                handler.start()
+            except OSError as error:
+                logging.debug(f'Node {sxglobals.ip_addr} {error}')
+                time.sleep(1.0)
+
+
 # ------------------------------------------------------------------------
 #    GUI
 # ------------------------------------------------------------------------
@@ -1204,6 +4249,11 @@ class SXBATCHER_gui(tk.Tk):
 
 
     def check_progress(self, t):
+        if sxglobals.tasks_total > 0:
+            self.progress_bar['value'] = round(sxglobals.tasks_done / sxglobals.tasks_total * 100)
+            if (sxglobals.eta is not None) and t.is_alive():
+                self.label_progress.configure(text=f'Processed {sxglobals.tasks_done}/{sxglobals.tasks_total}, ETA {round(sxglobals.eta)} seconds')
+
         if not t.is_alive():
             t.join()
             manager.finish_task()
@@ -1339,6 +4389,14 @@ class SXBATCHER_gui(tk.Tk):
                 sxglobals.debug = c4_bool.get()
             elif var == 'revision_bool':
                 sxglobals.revision_export = c5_bool.get()
+            elif var == 'affinity_bool':
+                sxglobals.cpu_affinity = affinity_bool.get()
+            elif var == 'sessions_bool':
+                sxglobals.blender_sessions = sessions_bool.get()
+            elif var == 'pool_bool':
+                sxglobals.blender_pool = pool_bool.get()
+                if not sxglobals.blender_pool:
+                    batch_local.shutdown_pool()
             elif var == 'share_cpus_bool' or var == 'share_cpus_int':
                 sxglobals.share_cpus = core_count_bool.get()
                 cpu_count = multiprocessing.cpu_count()
@@ -1366,6 +4424,17 @@ class SXBATCHER_gui(tk.Tk):
                     core_count_int.set(cpu_count)
                 else:
                     sxglobals.shared_cores = cores
+            elif var == 'adaptive_bool':
+                sxglobals.adaptive_cores = adaptive_bool.get()
+                isolation.update()
+            elif var in ('node_nice_int', 'node_cpu_limit_float', 'node_memory_limit_int'):
+                try:
+                    sxglobals.node_nice = max(0, min(19, node_nice_int.get()))
+                    sxglobals.node_cpu_limit = max(0.0, node_cpu_limit_float.get())
+                    sxglobals.node_memory_limit = max(0, node_memory_limit_int.get())
+                except Exception:
+                    return
+                isolation.update()
             elif var == 'use_nodes_bool':
                 sxglobals.use_network_nodes = use_nodes_bool.get()
                 if not sxglobals.use_network_nodes:
@@ -1660,6 +4729,28 @@ class SXBATCHER_gui(tk.Tk):
         c4_tip = Hovertip(c4,'Verbose Blender debug output.', hover_delay=1000)
         c5_tip = Hovertip(c5,'Only process files with changed revisions from previous export.\nHuge time saver!', hover_delay=1000)
 
+        pool_bool = tk.BooleanVar(self, name='pool_bool')
+        pool_bool.set(sxglobals.blender_pool)
+        pool_bool.trace_add('write', update_item)
+        c_pool = tk.Checkbutton(tab2, text='Persistent Blender Pool', variable=pool_bool, justify='left', anchor='w')
+        c_pool.grid(row=7, column=2, sticky='w')
+
+        sessions_bool = tk.BooleanVar(self, name='sessions_bool')
+        sessions_bool.set(sxglobals.blender_sessions)
+        sessions_bool.trace_add('write', update_item)
+        c_sessions = tk.Checkbutton(tab2, text='Multi-file Blender Sessions', variable=sessions_bool, justify='left', anchor='w')
+        c_sessions.grid(row=8, column=2, sticky='w')
+
+        c_sessions_tip = Hovertip(c_sessions,'Process several light files in one Blender launch.\nGroup sizes follow measured startup time and file durations.\nRequires a work script with session support, such as sx2_batch.py.', hover_delay=1000)
+        affinity_bool = tk.BooleanVar(self, name='affinity_bool')
+        affinity_bool.set(sxglobals.cpu_affinity)
+        affinity_bool.trace_add('write', update_item)
+        c_affinity = tk.Checkbutton(tab2, text='Pin Blenders to CPUs', variable=affinity_bool, justify='left', anchor='w')
+        c_affinity.grid(row=7, column=3, sticky='w')
+
+        c_affinity_tip = Hovertip(c_affinity,'Run each Blender on its own set of CPU cores.\nKeeps processes on one NUMA node where possible.\nLinux only.', hover_delay=1000)
+        c_pool_tip = Hovertip(c_pool,'Keep headless Blenders running between files.\nRequires a work script with pool support, such as sx2_batch.py.', hover_delay=1000)
+
         l_title_format = tk.Label(tab2, text='Export File Format')
         l_title_format.grid(row=9, column=1, padx=10, pady=10)
 
@@ -1802,8 +4893,40 @@ class SXBATCHER_gui(tk.Tk):
         self.job_dropdown['state'] = 'readonly'
         self.job_dropdown.grid(row=4, column=3, sticky='w')
 
-        c5_tip = Hovertip(c5,'Share CPU resources with other computers on your local network.\nBlender processes are launched as single-threaded if shared cores is below max.', hover_delay=1000)
-        e8_tip = Hovertip(e8,'Share CPU resources with other computers on your local network.\nBlender processes are launched as single-threaded if shared cores is below max.', hover_delay=1000)
+        adaptive_bool = tk.BooleanVar(self, name='adaptive_bool')
+        adaptive_bool.set(sxglobals.adaptive_cores)
+        adaptive_bool.trace_add('write', update_item)
+        c_adaptive = tk.Checkbutton(self.tab3, text='Adaptive', variable=adaptive_bool, justify='left', anchor='w')
+        c_adaptive.grid(row=3, column=3, sticky='w')
+
+        c_adaptive_tip = Hovertip(c_adaptive,'Share up to the selected cores depending on local load.\nCores are released when you use the computer, and shared again when it is idle.', hover_delay=1000)
+
+        node_nice_int = tk.IntVar(self, value=sxglobals.node_nice, name='node_nice_int')
+        node_cpu_limit_float = tk.DoubleVar(self, value=sxglobals.node_cpu_limit, name='node_cpu_limit_float')
+        node_memory_limit_int = tk.IntVar(self, value=sxglobals.node_memory_limit, name='node_memory_limit_int')
+        node_nice_int.trace_add('write', update_item)
+        node_cpu_limit_float.trace_add('write', update_item)
+        node_memory_limit_int.trace_add('write', update_item)
+
+        l_nice = tk.Label(self.tab3, text='Node Priority (nice):', justify='left', anchor='w')
+        l_nice.grid(row=2, column=4, sticky='w', padx=10)
+        e_nice = tk.Entry(self.tab3, textvariable=node_nice_int, width=5, justify='left')
+        e_nice.grid(row=2, column=5, sticky='w')
+        l_cpu_limit = tk.Label(self.tab3, text='CPU Limit (cores):', justify='left', anchor='w')
+        l_cpu_limit.grid(row=3, column=4, sticky='w', padx=10)
+        e_cpu_limit = tk.Entry(self.tab3, textvariable=node_cpu_limit_float, width=5, justify='left')
+        e_cpu_limit.grid(row=3, column=5, sticky='w')
+        l_memory_limit = tk.Label(self.tab3, text='Memory Limit (MB):', justify='left', anchor='w')
+        l_memory_limit.grid(row=4, column=4, sticky='w', padx=10)
+        e_memory_limit = tk.Entry(self.tab3, textvariable=node_memory_limit_int, width=7, justify='left')
+        e_memory_limit.grid(row=4, column=5, sticky='w')
+
+        e_nice_tip = Hovertip(e_nice,'Scheduling priority of Blenders processing tasks from other computers.\n0 is normal, 19 is lowest. They also get idle I/O priority.', hover_delay=1000)
+        e_cpu_limit_tip = Hovertip(e_cpu_limit,'cgroup v2 CPU limit for tasks from other computers, 0 for no limit.\nOnly used when a cgroup is writable. Changes apply to running Blenders.', hover_delay=1000)
+        e_memory_limit_tip = Hovertip(e_memory_limit,'cgroup v2 memory limit for tasks from other computers, 0 for no limit.\nOnly used when a cgroup is writable. Changes apply to running Blenders.', hover_delay=1000)
+
+        c5_tip = Hovertip(c5,'Share CPU resources with other computers on your local network.\nBlender thread counts are sized by file cost within the shared cores.', hover_delay=1000)
+        e8_tip = Hovertip(e8,'Share CPU resources with other computers on your local network.\nBlender thread counts are sized by file cost within the shared cores.', hover_delay=1000)
         c6_tip = Hovertip(c6,'Use network nodes to process file batches. \nEnable Share CPU Cores to ALSO use your local computer.', hover_delay=1000)
         job_tip = Hovertip(self.job_dropdown,'Simple sends files according to CPU core counts.\nCost-based uses CPU performance and catalogue object costs.\nSimple works better for simple objects.', hover_delay=1000)
 
@@ -1829,6 +4952,20 @@ exit_handler = SXBATCHER_exit_handler()
 sxglobals = SXBATCHER_globals()
 manager = SXBATCHER_batch_manager()
 batch_local = SXBATCHER_batch_local()
+autotuner = SXBATCHER_autotuner()
+cpu_topology = SXBATCHER_cpu_topology()
+scratch = SXBATCHER_scratch()
+isolation = SXBATCHER_isolation()
+watchdog = SXBATCHER_watchdog()
+fingerprints = SXBATCHER_fingerprints()
+dependencies = SXBATCHER_dependency_graph()
+revision_store = SXBATCHER_revision_store()
+artifact_cache = SXBATCHER_artifact_cache()
+cache_service = SXBATCHER_cache_service()
+cache_client = SXBATCHER_cache_client()
+batch_local.add_completion_hook(fingerprints.task_done)
+batch_local.add_completion_hook(artifact_cache.task_done)
+batch_local.add_completion_hook(revision_store.task_done)
 
 if __name__ == '__main__':
     args = init.get_args()
@@ -1841,16 +4978,18 @@ if __name__ == '__main__':
         ('level', getattr(logging, args.loglevel.upper()) if args.loglevel else None)
     ) if v })
 
-    # Pre-loop tasks and file batches
-    init.reset_batch_folders()
-
     if len(sys.argv) == 1:
         sxglobals.headless = False
     else:
         init.update_globals(args)
 
+    # Pre-loop tasks, clear job folders of earlier runs in the background,
+    # after the arguments have set the scratch location
+    scratch.delete_stale()
+
     # Do not enter main function tree unless paths in args are valid
-    if not sxglobals.validate_paths() and sxglobals.headless:
+    # a standalone cache service runs without Blender
+    if not sxglobals.validate_paths() and sxglobals.headless and not args.servecache:
         logging.critical('Invalid path arguments detected')
     else:
         broadcast_thread = SXBATCHER_node_broadcast_thread(init.payload(), sxglobals.group, sxglobals.discovery_port, sxglobals.ip_addr)
@@ -1865,9 +5004,27 @@ if __name__ == '__main__':
         file_receiving_thread.daemon = True
         file_receiving_thread.start()
 
+        load_monitor_thread = SXBATCHER_load_monitor_thread()
+        load_monitor_thread.daemon = True
+        load_monitor_thread.start()
+
+        if sxglobals.serve_cache:
+            cache_server_thread = SXBATCHER_cache_server_thread(sxglobals.cache_port)
+            cache_server_thread.daemon = True
+            cache_server_thread.start()
+            logging.info(f'Serving the artifact cache on port {sxglobals.cache_port}')
+
         # Main function tree
         if sxglobals.headless:
-            if args.node:
+            if args.affinitybenchmark:
+                manager.benchmark_affinity()
+            elif args.autotune:
+                manager.autotune()
+            elif args.servecache and not args.node and ((sxglobals.export_objs is None) or (len(sxglobals.export_objs) == 0)):
+                # Started as a standalone cache service
+                while not exit_handler.kill_now:
+                    time.sleep(1.0)
+            elif args.node:
                 # Started in headless worker node
                 logging.info('Starting in headless mode')
                 logging.info(f'Listening for network tasks on port {sxglobals.discovery_port}')
@@ -1883,6 +5040,7 @@ if __name__ == '__main__':
                     if sxglobals.remote_task:
                         sxglobals.remote_task = False
                         manager.task_handler(remote_task=True)
+                    isolation.check_conf()
                     time.sleep(1.0)
             else:
                 if (sxglobals.export_objs is not None) and (len(sxglobals.export_objs) > 0):
@@ -1915,6 +5073,7 @@ if __name__ == '__main__':
             gui.format_var.set(sxglobals.export_format)
             gui.mainloop()
 
-    # Housekeeping, clear batch folders
-    init.reset_batch_folders()
+    # Housekeeping, stop pooled Blenders and clear job folders
+    batch_local.shutdown_pool()
+    scratch.shutdown()
     logging.info('Exited gracefully')
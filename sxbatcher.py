@@ -13,6 +13,8 @@ bl_info = {
 import bpy
 import json
 import os
+import hashlib
+import numpy as np
 from bpy.app.handlers import persistent
 
 
@@ -89,16 +91,88 @@ def dict_lister(self, context):
     return enumItems
 
 
-# Offset revision prior to file save
+# Attribute data is read with foreach_get by data type: (property, components, dtype)
+attribute_layouts = {
+    'FLOAT': ('value', 1, np.float32),
+    'INT': ('value', 1, np.int32),
+    'INT8': ('value', 1, np.int32),
+    'BOOLEAN': ('value', 1, bool),
+    'FLOAT2': ('vector', 2, np.float32),
+    'INT32_2D': ('value', 2, np.int32),
+    'FLOAT_VECTOR': ('vector', 3, np.float32),
+    'FLOAT_COLOR': ('color', 4, np.float32),
+    'BYTE_COLOR': ('color', 4, np.float32),
+    'QUATERNION': ('value', 4, np.float32),
+}
+
+
+def hash_collection(fingerprint, collection, prop, components, dtype):
+    buffer = np.empty(len(collection) * components, dtype=dtype)
+    collection.foreach_get(prop, buffer)
+    fingerprint.update(buffer.tobytes())
+
+
+# Editable settings of a modifier or property group, object references by name.
+# Panel states do not change the exported mesh.
+def hash_properties(fingerprint, data):
+    for prop in data.bl_rna.properties:
+        if prop.is_readonly or (prop.type == 'COLLECTION') or (prop.identifier in ('name', 'is_active')):
+            continue
+        if prop.identifier.startswith('show_') and (prop.identifier not in ('show_viewport', 'show_render')):
+            continue
+        value = getattr(data, prop.identifier, None)
+        if prop.type == 'POINTER':
+            value = getattr(value, 'name', None)
+        elif isinstance(value, set):
+            value = sorted(value)
+        elif getattr(prop, 'is_array', False):
+            value = list(value)
+        fingerprint.update(f'{prop.identifier}={value};'.encode('utf-8'))
+
+
+# Hash of the evaluated mesh data, transform, materials and modifier stack of an object
+def get_fingerprint(obj, depsgraph):
+    fingerprint = hashlib.blake2b(digest_size=16)
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh = obj_eval.to_mesh()
+    try:
+        hash_collection(fingerprint, mesh.vertices, 'co', 3, np.float32)
+        hash_collection(fingerprint, mesh.loops, 'vertex_index', 1, np.int32)
+        hash_collection(fingerprint, mesh.polygons, 'loop_start', 1, np.int32)
+        hash_collection(fingerprint, mesh.polygons, 'material_index', 1, np.int32)
+        for attribute in sorted(mesh.attributes, key=lambda attribute: attribute.name):
+            # internal attributes such as selection and hide states are not geometry
+            if attribute.name.startswith('.'):
+                continue
+            fingerprint.update(f'{attribute.name}:{attribute.domain}:{attribute.data_type};'.encode('utf-8'))
+            if attribute.data_type in attribute_layouts:
+                hash_collection(fingerprint, attribute.data, *attribute_layouts[attribute.data_type])
+    finally:
+        obj_eval.to_mesh_clear()
+
+    fingerprint.update(np.array(obj.matrix_world, dtype=np.float32).tobytes())
+    fingerprint.update(str([slot.material.name if slot.material else '' for slot in obj.material_slots]).encode('utf-8'))
+    for modifier in obj.modifiers:
+        fingerprint.update(f'{modifier.name}:{modifier.type};'.encode('utf-8'))
+        hash_properties(fingerprint, modifier)
+    if getattr(obj, 'sx2', None) is not None:
+        hash_properties(fingerprint, obj.sx2)
+    return fingerprint.hexdigest()
+
+
+# Offset revision prior to file save, only for objects whose fingerprint has changed
 @persistent
 def save_pre_handler(dummy):
+    depsgraph = bpy.context.evaluated_depsgraph_get()
     for obj in bpy.data.objects:
         if obj.type == 'MESH':
+            fingerprint = get_fingerprint(obj, depsgraph)
             if ('revision' not in obj.keys()):
                 obj['revision'] = 1
-            else:
+            elif obj.get('sxbatcher_fingerprint') != fingerprint:
                 revision = obj['revision']
                 obj['revision'] = revision + 1
+            obj['sxbatcher_fingerprint'] = fingerprint
 
 
 # On file save, update revision and cost in the asset catalogue
@@ -115,6 +189,11 @@ def save_post_handler(dummy):
             if obj['revision'] > revision:
                 revision = obj['revision']
 
+    # Per-object revisions let the batcher export only the changed objects of a file
+    object_revisions = {obj.name: str(obj['revision']) for obj in objs}
+    # Parents let the batcher keep each hierarchy within one object shard
+    object_parents = {obj.name: obj.parent.name for obj in bpy.data.objects if obj.parent is not None}
+
     s = bpy.context.scene.statistics(bpy.context.view_layer)
     cost = s.split("Tris:")[1].split(' ')[0].replace(',', '')
 
@@ -134,6 +213,8 @@ def save_post_handler(dummy):
                     key_path = key.replace('//', os.path.sep)
                     if os.path.samefile(file_path, os.path.join(asset_path, key_path)):
                         catalogue_dict[category][key]['revision'] = str(revision)
+                        catalogue_dict[category][key]['object_revisions'] = object_revisions
+                        catalogue_dict[category][key]['object_parents'] = object_parents
                         catalogue_dict[category][key]['cost'] = cost
 
             with open(prefs.cataloguepath, 'w') as output:
@@ -349,7 +430,9 @@ class SXBATCHER_OT_catalogue_add(bpy.types.Operator):
 
         # Add asset to category and save entry with a platform-independent path separator
         objs = [obj.name for obj in context.view_layer.objects if obj.type == 'MESH']
-        sxglobals.catalogue[asset_category][file_rel_path.replace(os.path.sep, '//')] = {'tags': asset_tags, 'objects': objs, 'revision': str(revision), 'cost': cost}
+        object_revisions = {obj.name: str(obj['revision']) for obj in bpy.data.objects if obj.type == 'MESH'}
+        object_parents = {obj.name: obj.parent.name for obj in bpy.data.objects if obj.parent is not None}
+        sxglobals.catalogue[asset_category][file_rel_path.replace(os.path.sep, '//')] = {'tags': asset_tags, 'objects': objs, 'revision': str(revision), 'object_revisions': object_revisions, 'object_parents': object_parents, 'cost': cost}
         save_catalogue()
         return {'FINISHED'}
 